@@ -10,3 +10,11 @@ def get_version():
     return version
 
 __version__ = get_version()
+
+def register(model, sum_field):
+    """
+    Mirrors the vote sum of a model's objects in one of its fields, see
+    voting.registry.
+    """
+    from voting.registry import register
+    register(model, sum_field)
@@ -1,5 +1,7 @@
 from django.core.exceptions import PermissionDenied
 
+from voting.models import Vote
+
 def delete_queryset(modeladmin, request, queryset):
     # TODO 
     #
@@ -10,13 +12,12 @@ def delete_queryset(modeladmin, request, queryset):
     if not modeladmin.has_delete_permission(request):
         raise PermissionDenied
     else:
-        if queryset.count() == 1:
+        # Set-based, but still adjusts the VoteCount totals
+        deleted = Vote.objects.bulk_delete_votes(queryset)
+        if deleted == 1:
             msg = "1 vote was"
         else:
-            msg = "%s votes were" % queryset.count()
-
-        for obj in queryset.iterator():
-            obj.delete() # calling it this way to get custom delete() method
+            msg = "%s votes were" % deleted
 
         modeladmin.message_user(request, "%s successfully deleted." % msg)
 delete_queryset.short_description = "DELETE selected votes"
@@ -1,7 +1,89 @@
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList, SEARCH_VAR
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage, Paginator
+from django.core.validators import validate_ipv46_address
+from django.db import connections
 
 from voting.models import Vote, VoteCount, UPVOTE, DOWNVOTE
 from voting import actions
+from voting.utils import pack_ip
+
+# Below this many rows the exact count is cheap enough
+ESTIMATE_THRESHOLD = 100000
+
+def estimate_count(queryset):
+    '''
+    Returns the database's estimate of the number of rows of an unfiltered
+    queryset's table (PostgreSQL and MySQL only), or None.
+    '''
+    if queryset.query.where or queryset.query.distinct:
+        return None
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    cursor = connection.cursor()
+    if connection.vendor == 'postgresql':
+        cursor.execute("SELECT reltuples FROM pg_class WHERE relname = %s",
+                       [table])
+    elif connection.vendor == 'mysql':
+        cursor.execute("SELECT table_rows FROM information_schema.tables "
+                       "WHERE table_schema = DATABASE() AND table_name = %s",
+                       [table])
+    else:
+        return None
+    row = cursor.fetchone()
+    if row is None or row[0] is None:
+        return None
+    return int(row[0])
+
+class EstimatedCountPaginator(Paginator):
+    '''
+    Paginator that uses the database's estimate of the number of rows of a
+    big, unfiltered table instead of an exact (and slow) `COUNT(*)`.
+    '''
+    def _get_count(self):
+        if self._count is None:
+            estimate = estimate_count(self.object_list)
+            if estimate is not None and estimate >= ESTIMATE_THRESHOLD:
+                self._count = estimate
+            else:
+                self._count = self.object_list.count()
+        return self._count
+    count = property(_get_count)
+
+class EstimatedCountChangeList(ChangeList):
+    '''
+    ChangeList that also estimates the unfiltered total it shows next to
+    search results (see EstimatedCountPaginator), rather than counting the
+    whole table.
+    '''
+    def get_results(self, request):
+        paginator = self.model_admin.get_paginator(request, self.queryset,
+                                                   self.list_per_page)
+        result_count = paginator.count
+        if self.get_filters_params() or self.params.get(SEARCH_VAR):
+            full_result_count = EstimatedCountPaginator(self.root_queryset,
+                                                        self.list_per_page).count
+        else:
+            full_result_count = result_count
+        can_show_all = result_count <= self.list_max_show_all
+        multi_page = result_count > self.list_per_page
+
+        if (self.show_all and can_show_all) or not multi_page:
+            result_list = self.queryset._clone()
+        else:
+            try:
+                result_list = paginator.page(self.page_num + 1).object_list
+            except InvalidPage:
+                raise IncorrectLookupParameters
+
+        self.result_count = result_count
+        self.full_result_count = full_result_count
+        self.result_list = result_list
+        self.can_show_all = can_show_all
+        self.multi_page = multi_page
+        self.paginator = paginator
 
 def created_format(obj):
     '''
@@ -21,17 +103,49 @@ direction_format.short_description = 'Direction'
 direction_format.allow_tags = True
 direction_format.admin_order_field = 'direction'
 
+def ip_format(obj):
+    '''
+    The IP address, whether stored as text or packed.
+    '''
+    return obj.ip
+ip_format.short_description = 'IP address'
+
 
 class VoteAdmin(admin.ModelAdmin):
-    list_display = (created_format, 'user', direction_format, 'ip_address','votecount')
+    list_display = (created_format, 'user', direction_format, ip_format, 'votecount')
+    list_select_related = ('user', 'votecount')
     search_fields = ('ip_address',)
     date_hierarchy = 'date_created'
+    ordering = ('-date_created',)
     actions = [ actions.delete_queryset, ]
+    paginator = EstimatedCountPaginator
 
     def __init__(self, *args, **kwargs):
         super(VoteAdmin, self).__init__(*args, **kwargs)
         self.list_display_links = (None,)
 
+    def get_queryset(self, request):
+        # The votecount column shows the voted object: load those with one
+        # query per content type rather than one per row
+        qs = super(VoteAdmin, self).get_queryset(request)
+        return qs.prefetch_related('votecount__content_object')
+
+    def get_changelist(self, request, **kwargs):
+        return EstimatedCountChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        results, use_distinct = super(VoteAdmin, self).get_search_results(
+                request, queryset, search_term)
+        # Packed addresses (see VOTECOUNT_PACKED_IP) can only be matched
+        # whole; a truncated one also matches the rest of its network
+        term = search_term.strip()
+        try:
+            validate_ipv46_address(term)
+        except ValidationError:
+            return results, use_distinct
+        packed = [pack_ip(term), pack_ip(term, truncate=True)]
+        return results | queryset.filter(ip_packed__in=packed), use_distinct
+
     def get_actions(self, request):
         # Override the default `get_actions` to ensure that our model's
         # `delete()` method is called.
@@ -54,6 +168,10 @@ class VoteAdmin(admin.ModelAdmin):
 class VoteCountAdmin(admin.ModelAdmin):
     list_display = ('content_object','vote_sum','modified')
     fields = ('upvotes', 'downvotes')
+
+    def get_queryset(self, request):
+        qs = super(VoteCountAdmin, self).get_queryset(request)
+        return qs.prefetch_related('content_object')
     
     # TODO: Another option
     #The fields option, unlike list_display, may only contain names of fields on the model or the form specified by form. It may contain callables only if they are listed in readonly_fields.
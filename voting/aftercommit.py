@@ -0,0 +1,57 @@
+'''
+Holds back the side effects of votes that live outside the database (the
+vote buffer, the cache and the leaderboards) until the votes' transaction
+commits.
+
+The vote methods run in `aftercommit.atomic()` blocks rather than plain
+transaction.atomic() ones and hand those side effects to `defer()`.  They
+run once the outermost such block exits, in the order they were deferred,
+and are dropped with the part of the transaction that rolls back, eg when a
+vote_cast receiver raises.
+
+Outside of a block deferred calls run right away.  Note that a transaction
+of your own around the vote methods (eg ATOMIC_REQUESTS) commits after the
+block exits, so if it rolls back the side effects have already been applied.
+'''
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+
+_local = threading.local()
+
+@contextmanager
+def atomic(using=None):
+    '''
+    Like transaction.atomic(), but collects the calls deferred inside it.
+    '''
+    queue = getattr(_local, 'queue', None)
+    outermost = queue is None
+    if outermost:
+        queue = _local.queue = []
+    mark = len(queue)
+    try:
+        with transaction.atomic(using=using):
+            yield
+    except:
+        # Whatever was deferred in here was rolled back with it
+        del queue[mark:]
+        raise
+    finally:
+        if outermost:
+            del _local.queue
+
+    if outermost:
+        for func, args, kwargs in queue:
+            func(*args, **kwargs)
+
+def defer(func, *args, **kwargs):
+    '''
+    Calls `func` once the outermost atomic() block commits, or right away
+    outside of one.
+    '''
+    queue = getattr(_local, 'queue', None)
+    if queue is None:
+        func(*args, **kwargs)
+    else:
+        queue.append((func, args, kwargs))
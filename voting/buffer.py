@@ -0,0 +1,131 @@
+'''
+Optional write-behind buffering of vote totals.
+
+With VOTECOUNT_BUFFERED = True, votes still insert their Vote rows right
+away, but the changes to the VoteCount totals are collected in an
+in-process buffer and written to the database by a background thread every
+VOTECOUNT_BUFFER_INTERVAL seconds (default 5), in as few UPDATEs as
+possible.  That takes the row lock of very popular objects out of the vote
+path.
+
+Each process has its own buffer, so reads in one process only see the
+votes that are still pending in that process (see VoteCount.current_totals).
+Pending changes are flushed when the process exits; if it dies before
+that, turn buffering off in every process and run `manage.py
+rebuild_vote_counts` to recompute the totals from the Vote rows.  It
+refuses to fix anything while buffering is on, since it can't tell the
+changes still pending in other processes from drift.
+'''
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+def is_enabled():
+    return getattr(settings, 'VOTECOUNT_BUFFERED', False)
+
+def get_interval():
+    return getattr(settings, 'VOTECOUNT_BUFFER_INTERVAL', 5)
+
+
+class VoteBuffer(object):
+    '''
+    Thread-safe {votecount_pk: [upvotes, downvotes]} map of the changes that
+    haven't been written to the database yet.  It is split into shards with
+    their own locks so concurrent votes rarely wait on each other.
+    '''
+
+    def __init__(self, shards=16):
+        self._pending = [{} for i in range(shards)]
+        self._locks = [threading.Lock() for i in range(shards)]
+
+    def _shard(self, votecount_pk):
+        return hash(votecount_pk) % len(self._pending)
+
+    def add(self, votecount_pk, upvotes=0, downvotes=0):
+        i = self._shard(votecount_pk)
+        with self._locks[i]:
+            totals = self._pending[i].setdefault(votecount_pk, [0, 0])
+            totals[0] += upvotes
+            totals[1] += downvotes
+
+    def get(self, votecount_pk):
+        '''
+        Returns the pending (upvotes, downvotes) change of a VoteCount.
+        '''
+        i = self._shard(votecount_pk)
+        with self._locks[i]:
+            return tuple(self._pending[i].get(votecount_pk, (0, 0)))
+
+    def drain(self):
+        '''
+        Empties the buffer and returns everything that was pending.
+        '''
+        drained = {}
+        for i, lock in enumerate(self._locks):
+            with lock:
+                pending, self._pending[i] = self._pending[i], {}
+            drained.update(pending)
+        return drained
+
+buffer = VoteBuffer()
+
+
+def add(votecount_pk, upvotes=0, downvotes=0):
+    buffer.add(votecount_pk, upvotes=upvotes, downvotes=downvotes)
+    start_flusher()
+
+def get_pending(votecount_pk):
+    return buffer.get(votecount_pk)
+
+def flush():
+    '''
+    Writes all pending changes to the database (see
+    VoteCountManager.apply_changes).
+
+    Returns the number of VoteCounts that were updated.
+    '''
+    from voting.models import VoteCount
+
+    drained = buffer.drain()
+    try:
+        VoteCount.objects.apply_changes(drained)
+    except Exception:
+        # Put everything back so the next flush can try again
+        for votecount_pk, (upvotes, downvotes) in drained.items():
+            buffer.add(votecount_pk, upvotes=upvotes, downvotes=downvotes)
+        raise
+    return len(drained)
+
+
+_flusher = None
+_flusher_lock = threading.Lock()
+
+def _flush_forever(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            flush()
+        except Exception:
+            logger.exception("Flushing the vote buffer failed")
+
+def start_flusher():
+    '''
+    Starts the background thread that flushes the buffer, unless it's
+    already running in this process.
+    '''
+    global _flusher
+    if _flusher is not None:
+        return
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_forever,
+                                        args=(get_interval(),),
+                                        name='voting-buffer-flusher')
+            _flusher.daemon = True
+            _flusher.start()
+            atexit.register(flush)
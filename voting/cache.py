@@ -0,0 +1,127 @@
+'''
+Optional cache for vote totals, built on Django's cache framework.
+
+Set VOTECOUNT_CACHE to the name of a cache in CACHES (eg, 'default') to
+enable it.  Totals are cached per (content_type_id, object_pk) for
+VOTECOUNT_CACHE_TIMEOUT seconds (default 300) and every vote increments the
+cached totals atomically, so hot objects are read from memory instead of the
+VoteCount table.
+'''
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.encoding import force_bytes
+
+# How long a cache miss may be "locked" by the process loading it
+LOCK_TIMEOUT = 10
+
+# How often and how long other processes wait for that load to finish before
+# going to the database themselves
+LOCK_RETRIES = 5
+LOCK_WAIT = 0.05
+
+# A vote on an object whose totals aren't cached marks them "dirty" for this
+# long, and totals loaded while they are dirty are only cached for this long
+DIRTY_TIMEOUT = 5
+
+def get_cache():
+    '''
+    Returns the cache configured with VOTECOUNT_CACHE, or None if vote
+    totals aren't cached.
+    '''
+    alias = getattr(settings, 'VOTECOUNT_CACHE', None)
+    if not alias:
+        return None
+    return caches[alias]
+
+def is_enabled():
+    return get_cache() is not None
+
+def get_timeout():
+    return getattr(settings, 'VOTECOUNT_CACHE_TIMEOUT', 300)
+
+def make_keys(content_type_id, object_pk):
+    '''
+    Returns the cache keys of an object's upvote and downvote totals.  The
+    object_pk is hashed since it may be any string.
+    '''
+    digest = hashlib.md5(force_bytes(object_pk)).hexdigest()
+    key = 'voting:totals:%s:%s' % (content_type_id, digest)
+    return key + ':up', key + ':down'
+
+def make_dirty_key(up_key):
+    return up_key[:-len(':up')] + ':dirty'
+
+def get_totals(content_type_id, object_pk, load):
+    '''
+    Returns the cached (upvotes, downvotes) totals of an object.
+
+    On a cache miss the totals are loaded by calling `load()`.  Only one
+    process at a time does that for a given object; the others wait for it
+    briefly instead of all hitting the database at once.
+    '''
+    cache = get_cache()
+    if cache is None:
+        return load()
+
+    up_key, down_key = make_keys(content_type_id, object_pk)
+    cached = cache.get_many([up_key, down_key])
+    if up_key in cached and down_key in cached:
+        return cached[up_key], cached[down_key]
+
+    lock_key = up_key[:-len(':up')] + ':lock'
+    if not cache.add(lock_key, 1, LOCK_TIMEOUT):
+        for i in range(LOCK_RETRIES):
+            time.sleep(LOCK_WAIT)
+            cached = cache.get_many([up_key, down_key])
+            if up_key in cached and down_key in cached:
+                return cached[up_key], cached[down_key]
+        return load()
+
+    try:
+        upvotes, downvotes = load()
+        # A vote that came in while we were loading couldn't increment the
+        # totals, and may or may not be in what we loaded, so then only
+        # cache them briefly
+        timeout = get_timeout()
+        if cache.get(make_dirty_key(up_key)) is not None:
+            timeout = min(timeout, DIRTY_TIMEOUT)
+        # add() rather than set() so we don't overwrite totals another
+        # process cached in the meantime
+        cache.add(up_key, upvotes, timeout)
+        cache.add(down_key, downvotes, timeout)
+    finally:
+        cache.delete(lock_key)
+    return upvotes, downvotes
+
+def mark_dirty(content_type_id, object_pk):
+    '''
+    Marks the totals of an object dirty ahead of a change, so totals loaded
+    before the change is applied are only cached briefly.
+    '''
+    cache = get_cache()
+    if cache is not None:
+        up_key, down_key = make_keys(content_type_id, object_pk)
+        cache.set(make_dirty_key(up_key), 1, DIRTY_TIMEOUT)
+
+def incr_totals(content_type_id, object_pk, upvotes=0, downvotes=0):
+    '''
+    Atomically applies a vote to the cached totals of an object.  Totals
+    that aren't cached are left alone; they will be loaded on the next read,
+    but are marked dirty in case a read is loading them right now.
+    '''
+    cache = get_cache()
+    if cache is None:
+        return
+
+    up_key, down_key = make_keys(content_type_id, object_pk)
+    for key, delta in ((up_key, upvotes), (down_key, downvotes)):
+        if not delta:
+            continue
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            # Not cached
+            cache.set(make_dirty_key(up_key), 1, DIRTY_TIMEOUT)
@@ -0,0 +1,224 @@
+'''
+Optional leaderboards of the objects that gained the most (net) votes in the
+current hour, day or week, kept in Django's cache per content type.
+
+Configure them per content type with VOTECOUNT_LEADERBOARDS, eg:
+
+    VOTECOUNT_LEADERBOARDS = {
+        'news.article': {'size': 100, 'windows': ('day', 'week')},
+    }
+
+Every vote adds its net change to the boards of its content type whose
+current period it was cast in, so reading a board with get_top() is a single
+cache get; the database is only asked (see rebuild()) when a board isn't
+cached yet, eg at the start of a new day.
+Boards live in the cache named by VOTECOUNT_LEADERBOARD_CACHE (default
+'default'); use a shared cache if you run more than one process.
+
+A board keeps at most twice its size of objects.  While fewer objects than
+that get votes in a period the board is exact; beyond that, an object that
+fell off the board comes back with only the votes it got since.  Run the
+`rebuild_leaderboards` command now and then if that matters.
+'''
+import datetime
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from voting.cache import LOCK_TIMEOUT, LOCK_RETRIES, LOCK_WAIT
+
+WINDOWS = ('hour', 'day', 'week')
+
+# How many objects a board keeps, relative to its size
+CAPACITY_FACTOR = 2
+
+# Changes this process couldn't add to a board because another process held
+# its lock: {(content_type_id, window): (board key, [(time, votecount_pk,
+# change)])}.  They are added the next time this process gets the lock.
+_pending = {}
+_pending_lock = threading.Lock()
+
+def is_enabled():
+    return bool(getattr(settings, 'VOTECOUNT_LEADERBOARDS', None))
+
+def get_cache():
+    return caches[getattr(settings, 'VOTECOUNT_LEADERBOARD_CACHE', 'default')]
+
+def get_label(content_type_id):
+    from django.contrib.contenttypes.models import ContentType
+    ct = ContentType.objects.get_for_id(content_type_id)
+    return '%s.%s' % (ct.app_label, ct.model)
+
+def get_config(content_type_id):
+    '''
+    Returns the VOTECOUNT_LEADERBOARDS entry of a content type, or None if it
+    has no leaderboards.
+    '''
+    boards = getattr(settings, 'VOTECOUNT_LEADERBOARDS', None)
+    if not boards:
+        return None
+    return boards.get(get_label(content_type_id))
+
+def period_start(window, now=None):
+    '''
+    Returns when the current period of a window ('hour', 'day' or 'week')
+    started.  Weeks start on Monday.
+    '''
+    if window not in WINDOWS:
+        raise ValueError("Unknown window %r, use one of: %s" % (window,
+                ', '.join(WINDOWS)))
+    start = (now or timezone.now()).replace(minute=0, second=0, microsecond=0)
+    if window != 'hour':
+        start = start.replace(hour=0)
+    if window == 'week':
+        start -= datetime.timedelta(days=start.weekday())
+    return start
+
+def make_key(content_type_id, window, start):
+    return 'voting:leaderboard:%s:%s:%s' % (content_type_id, window,
+                                           start.strftime('%Y%m%d%H'))
+
+def get_timeout(window):
+    # Long enough to outlive the period
+    return {'hour': 2 * 3600, 'day': 2 * 86400, 'week': 2 * 7 * 86400}[window]
+
+def trim(scores, capacity):
+    '''
+    Drops all but the `capacity` highest scores of a {votecount_pk: score}
+    dict.
+    '''
+    if len(scores) > capacity:
+        kept = sorted(scores.items(), key=lambda item: -item[1])[:capacity]
+        scores = dict(kept)
+    return scores
+
+def rebuild(content_type_id, window, now=None):
+    '''
+    Loads the board of a content type for the current period of `window`
+    from the Vote rows cast in that period, caches and returns it as a
+    {votecount_pk: net votes} dict.
+    '''
+    from django.db.models import Sum
+    from voting.models import Vote
+
+    config = get_config(content_type_id) or {}
+    capacity = config.get('size', 100) * CAPACITY_FACTOR
+    start = period_start(window, now)
+    built = time.time()
+    rows = Vote.objects.order_by() \
+                .filter(votecount__content_type=content_type_id,
+                        date_created__gte=start) \
+                .values('votecount').annotate(score=Sum('direction')) \
+                .order_by('-score')[:capacity]
+    scores = dict((row['votecount'], row['score']) for row in rows)
+    key = make_key(content_type_id, window, start)
+    get_cache().set_many({key: scores, key + ':built': built},
+                         get_timeout(window))
+    return scores
+
+def get_top(content_type_id, window='day', limit=None):
+    '''
+    Returns the objects of a content type that gained the most net votes in
+    the current period of `window`, as a list of (votecount_pk, net votes)
+    pairs, best first.  At most `limit` (default: the board's size) are
+    returned.
+    '''
+    config = get_config(content_type_id)
+    if config is None:
+        raise ValueError("There's no leaderboard for %s, see "
+                "VOTECOUNT_LEADERBOARDS" % get_label(content_type_id))
+    if window not in config.get('windows', ('day',)):
+        raise ValueError("The %s leaderboard has no %r window" % (
+                get_label(content_type_id), window))
+
+    cache = get_cache()
+    key = make_key(content_type_id, window, period_start(window))
+    scores = cache.get(key)
+    if scores is None:
+        # Only one process rebuilds a missing board, the others wait for it
+        if cache.add(key + ':lock', 1, LOCK_TIMEOUT):
+            try:
+                scores = rebuild(content_type_id, window)
+            finally:
+                cache.delete(key + ':lock')
+        else:
+            for i in range(LOCK_RETRIES):
+                time.sleep(LOCK_WAIT)
+                scores = cache.get(key)
+                if scores is not None:
+                    break
+            else:
+                scores = rebuild(content_type_id, window)
+
+    top = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+    return top[:limit or config.get('size', 100)]
+
+def record(content_type_id, votecount_pk, change, date_created):
+    '''
+    Adds the net change of a vote cast at `date_created` to the boards of a
+    content type, if it was cast in their current period; that's how
+    rebuild() counts it.  Boards that aren't cached are left alone; they are
+    rebuilt on the next read.
+
+    Boards are updated under a short lock.  If another process holds it,
+    the change is kept in this process and added the next time it gets the
+    lock, rather than waiting for it.
+    '''
+    if not change:
+        return
+    config = get_config(content_type_id)
+    if config is None:
+        return
+
+    cache = get_cache()
+    capacity = config.get('size', 100) * CAPACITY_FACTOR
+    recorded = time.time()
+    for window in config.get('windows', ('day',)):
+        start = period_start(window)
+        if date_created < start:
+            continue
+        key = make_key(content_type_id, window, start)
+        with _pending_lock:
+            pending_key, changes = _pending.get((content_type_id, window),
+                                                (key, []))
+            if pending_key != key:
+                # Left over from a past period
+                changes = []
+            changes.append((recorded, votecount_pk, change))
+            _pending[(content_type_id, window)] = (key, changes)
+
+        lock_key = key + ':lock'
+        if not cache.add(lock_key, 1, LOCK_TIMEOUT):
+            continue
+        try:
+            with _pending_lock:
+                changes = _pending.pop((content_type_id, window), (key, []))[1]
+            cached = cache.get_many([key, key + ':built'])
+            scores = cached.get(key)
+            if scores is None:
+                continue
+            built = cached.get(key + ':built', 0)
+            for recorded_at, pk, pk_change in changes:
+                # Changes from before the board was rebuilt are in it already
+                if recorded_at >= built:
+                    scores[pk] = scores.get(pk, 0) + pk_change
+            cache.set(key, trim(scores, capacity), get_timeout(window))
+        finally:
+            cache.delete(lock_key)
+
+def drop(content_type_id):
+    '''
+    Drops the current boards of a content type, eg after votes were deleted
+    in bulk, so they are rebuilt on the next read.
+    '''
+    config = get_config(content_type_id)
+    if config is None:
+        return
+    keys = []
+    for window in config.get('windows', ('day',)):
+        key = make_key(content_type_id, window, period_start(window))
+        keys.extend([key, key + ':built'])
+    get_cache().delete_many(keys)
@@ -0,0 +1,90 @@
+import csv
+import datetime
+import gzip
+import json
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+
+from voting.models import Vote
+from voting.utils import unpack_ip
+
+EXPORT_FIELDS = ('id', 'user', 'votecount', 'direction', 'ip_address',
+                 'date_created')
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--older-than', action='store', type='int',
+            dest='older_than', default=None,
+            help="Archive the votes older than this many days."),
+        make_option('--batch-size', action='store', type='int',
+            dest='batch_size', default=1000,
+            help="How many vote pks to archive at once. Default is 1000."),
+        make_option('--sleep', action='store', type='float', dest='sleep',
+            default=0, help="Seconds to pause between batches."),
+        make_option('--export', action='store', dest='export', default=None,
+            help="Write the archived votes to this gzipped file first."),
+        make_option('--format', action='store', dest='format',
+            default='jsonl', choices=('jsonl', 'csv'),
+            help="Format of the export, jsonl (default) or csv."),
+    )
+    help = "Deletes old Vote rows a batch at a time, keeping the VoteCount " \
+           "totals (and VoteBuckets) as they are, and optionally exports " \
+           "them first."
+
+    def handle(self, *args, **options):
+        if options['older_than'] is None:
+            raise CommandError("--older-than is required")
+        cutoff = timezone.now() - \
+                 datetime.timedelta(days=options['older_than'])
+        batch_size = options['batch_size']
+
+        old_votes = Vote.objects.filter(date_created__lt=cutoff)
+        bounds = old_votes.aggregate(min_pk=Min('pk'), max_pk=Max('pk'))
+        if bounds['min_pk'] is None:
+            self.stdout.write("No votes to archive.")
+            return
+
+        export = write = None
+        if options['export']:
+            export = gzip.open(options['export'], 'wb')
+            if options['format'] == 'csv':
+                writer = csv.writer(export)
+                writer.writerow(EXPORT_FIELDS)
+                write = lambda row: writer.writerow(
+                        [force_bytes(value) for value in row])
+            else:
+                write = lambda row: export.write(json.dumps(
+                        dict(zip(EXPORT_FIELDS, row)),
+                        default=lambda value: value.isoformat()) + '\n')
+
+        archived = 0
+        try:
+            for low in range(bounds['min_pk'], bounds['max_pk'] + 1,
+                             batch_size):
+                batch = old_votes.filter(pk__gte=low, pk__lt=low + batch_size)
+                if write is not None:
+                    rows = batch.order_by('pk').values_list(
+                                *(EXPORT_FIELDS + ('ip_packed',)))
+                    for row in rows.iterator():
+                        row, ip_packed = list(row[:-1]), row[-1]
+                        if ip_packed is not None:
+                            row[EXPORT_FIELDS.index('ip_address')] = \
+                                    unpack_ip(ip_packed)
+                        write(row)
+                    # Don't delete anything that isn't safely exported
+                    export.flush()
+                archived += Vote.objects.bulk_delete_votes(batch,
+                                                           save_votecount=True)
+                if options['sleep']:
+                    time.sleep(options['sleep'])
+        finally:
+            if export is not None:
+                export.close()
+
+        self.stdout.write("Archived %s votes." % archived)
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from voting.models import VoteCount, VoteCountShard
+
+
+class Command(BaseCommand):
+    args = '[app_label.model ...]'
+    help = "Moves the totals of the VoteCount counter shards back into the " \
+           "VoteCount rows, optionally only for the given models."
+
+    def handle(self, *labels, **options):
+        qs = VoteCountShard.objects.exclude(upvotes=0, downvotes=0)
+        for label in labels:
+            app_label, model = label.lower().split('.')
+            qs = qs.filter(votecount__content_type__app_label=app_label,
+                           votecount__content_type__model=model)
+
+        folded = 0
+        pks = qs.values_list('votecount', flat=True).distinct()
+        for votecount in VoteCount.objects.filter(pk__in=list(pks)).iterator():
+            votecount.fold_shards()
+            folded += 1
+
+        self.stdout.write("Folded the shards of %s VoteCounts." % folded)
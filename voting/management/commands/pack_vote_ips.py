@@ -0,0 +1,49 @@
+import time
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Min
+
+from voting.models import Vote
+from voting.utils import pack_ip
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', action='store', type='int',
+            dest='batch_size', default=1000,
+            help="How many vote pks to convert at once. Default is 1000."),
+        make_option('--sleep', action='store', type='float', dest='sleep',
+            default=0, help="Seconds to pause between batches."),
+    )
+    help = "Moves the IP addresses of existing votes from the ip_address " \
+           "text to the packed ip_packed column (see VOTECOUNT_PACKED_IP), " \
+           "a batch at a time so it can run on a live site."
+
+    def handle(self, *args, **options):
+        truncate = getattr(settings, 'VOTECOUNT_TRUNCATE_IP', False)
+        batch_size = options['batch_size']
+
+        text_votes = Vote.objects.filter(ip_address__isnull=False)
+        bounds = text_votes.aggregate(min_pk=Min('pk'), max_pk=Max('pk'))
+        if bounds['min_pk'] is None:
+            self.stdout.write("No IP addresses to pack.")
+            return
+
+        packed = 0
+        for low in range(bounds['min_pk'], bounds['max_pk'] + 1, batch_size):
+            batch = text_votes.filter(pk__gte=low, pk__lt=low + batch_size)
+            # Votes often share addresses: one UPDATE per address
+            with transaction.atomic():
+                ips = batch.order_by().values_list('ip_address',
+                                                   flat=True).distinct()
+                for ip_address in list(ips):
+                    packed += batch.filter(ip_address=ip_address).update(
+                            ip_address=None,
+                            ip_packed=pack_ip(ip_address, truncate=truncate))
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write("Packed the IP addresses of %s votes." % packed)
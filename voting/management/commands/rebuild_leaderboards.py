@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+
+from voting import leaderboard
+
+
+class Command(BaseCommand):
+    args = '[app_label.model ...]'
+    help = "Rebuilds the cached leaderboards (see VOTECOUNT_LEADERBOARDS) " \
+           "from the votes, optionally only for the given models."
+
+    def handle(self, *labels, **options):
+        boards = getattr(settings, 'VOTECOUNT_LEADERBOARDS', None) or {}
+        for label in labels or sorted(boards):
+            label = label.lower()
+            if label not in boards:
+                raise CommandError("There's no leaderboard for %s" % label)
+            app_label, model = label.split('.')
+            ct = ContentType.objects.get_by_natural_key(app_label, model)
+            for window in boards[label].get('windows', ('day',)):
+                leaderboard.rebuild(ct.pk, window)
+                self.stdout.write("Rebuilt the %s leaderboard of %s." % (
+                                  window, label))
@@ -0,0 +1,72 @@
+import datetime
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from voting.models import Vote, VoteBucket, VoteCount, floor_hour
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', action='store', type='int',
+            dest='batch_size', default=1000,
+            help="How many VoteCounts to recount at once. Default is 1000."),
+        make_option('--sleep', action='store', type='float', dest='sleep',
+            default=0, help="Seconds to pause between batches."),
+    )
+    help = "Recounts the hourly VoteBuckets (see VOTECOUNT_VOTE_BUCKETS) " \
+           "from the Vote rows, a batch of VoteCounts at a time, from the " \
+           "hour of the oldest vote up to the current hour. Run it before " \
+           "turning the setting on, and once more after the hour it was " \
+           "turned on in."
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        # Votes are only bucketed in their own hour, so the hours before the
+        # current one can be recounted while votes come in
+        cutoff = floor_hour(timezone.now())
+        # Buckets of archived votes have no Vote rows left to count them
+        # from, so leave the hours before the oldest vote alone, and its
+        # hour too if some of its votes may have been archived
+        oldest = Vote.objects.aggregate(oldest=Min('date_created'))['oldest']
+        if oldest is None:
+            self.stdout.write("No votes to count.")
+            return
+        since = floor_hour(oldest)
+        if VoteBucket.objects.filter(start__lt=since).exists():
+            since += datetime.timedelta(hours=1)
+
+        max_pk = VoteCount.objects.aggregate(max_pk=Max('pk'))['max_pk'] or 0
+        buckets = 0
+        for low in range(0, max_pk + 1, batch_size):
+            with transaction.atomic():
+                # The votes are locked so a concurrent withdrawal can't
+                # take a vote off a bucket that's being recounted
+                rows = Vote.objects.select_for_update().order_by() \
+                            .filter(votecount__gte=low,
+                                    votecount__lt=low + batch_size,
+                                    date_created__gte=since,
+                                    date_created__lt=cutoff) \
+                            .values_list('votecount', 'date_created')
+                counts = {}
+                for votecount_pk, date_created in rows.iterator():
+                    key = (votecount_pk, floor_hour(date_created))
+                    counts[key] = counts.get(key, 0) + 1
+
+                VoteBucket.objects.filter(votecount__gte=low,
+                                          votecount__lt=low + batch_size,
+                                          start__gte=since,
+                                          start__lt=cutoff).delete()
+                VoteBucket.objects.bulk_create([
+                    VoteBucket(votecount_id=votecount_pk, start=start,
+                               votes=votes)
+                    for (votecount_pk, start), votes in counts.items()])
+            buckets += len(counts)
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write("Recounted %s vote buckets." % buckets)
@@ -0,0 +1,135 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Max, Sum
+
+from voting import buffer as vote_buffer
+from voting.models import Vote, VoteCount, VoteCountShard, UPVOTE
+
+
+def count_votes(**filters):
+    '''
+    Returns a {votecount_pk: (upvotes, downvotes)} map counted from the Vote
+    rows with one grouped aggregate.
+    '''
+    totals = {}
+    rows = Vote.objects.filter(**filters).order_by() \
+                .values('votecount', 'direction').annotate(votes=Count('id'))
+    for row in rows:
+        upvotes, downvotes = totals.get(row['votecount'], (0, 0))
+        if row['direction'] == UPVOTE:
+            upvotes += row['votes']
+        else:
+            downvotes += row['votes']
+        totals[row['votecount']] = (upvotes, downvotes)
+    return totals
+
+def stored_totals(**filters):
+    '''
+    Returns a {votecount_pk: (upvotes, downvotes)} map of the stored totals,
+    including the counter shards.
+    '''
+    totals = dict((pk, (upvotes, downvotes)) for pk, upvotes, downvotes in
+                  VoteCount.objects.filter(**filters)
+                        .values_list('pk', 'upvotes', 'downvotes'))
+    shard_filters = dict(('votecount__' + key, value)
+                         for key, value in filters.items())
+    rows = VoteCountShard.objects.filter(**shard_filters).order_by() \
+                .values('votecount').annotate(upvotes=Sum('upvotes'),
+                                              downvotes=Sum('downvotes'))
+    for row in rows:
+        upvotes, downvotes = totals.get(row['votecount'], (0, 0))
+        totals[row['votecount']] = (upvotes + row['upvotes'],
+                                    downvotes + row['downvotes'])
+    return totals
+
+def archived_totals(**filters):
+    '''
+    Returns a {votecount_pk: (upvotes, downvotes)} map of the votes deleted
+    with save_votecount=True, eg by archive_votes.
+    '''
+    return dict((pk, (upvotes, downvotes)) for pk, upvotes, downvotes in
+                VoteCount.objects.filter(**filters)
+                    .exclude(archived_upvotes=0, archived_downvotes=0)
+                    .values_list('pk', 'archived_upvotes',
+                                 'archived_downvotes'))
+
+def find_drift(**filters):
+    '''
+    Returns a {votecount_pk: (upvotes, downvotes)} map of the changes needed
+    to make the stored totals match the Vote rows plus the archived votes.
+    '''
+    stored = stored_totals(**filters)
+    counted = count_votes(**dict(('votecount__' + key, value)
+                                 for key, value in filters.items()))
+    archived = archived_totals(**filters)
+    drift = {}
+    for pk, (upvotes, downvotes) in stored.items():
+        counted_upvotes, counted_downvotes = counted.get(pk, (0, 0))
+        archived_upvotes, archived_downvotes = archived.get(pk, (0, 0))
+        counted_upvotes += archived_upvotes
+        counted_downvotes += archived_downvotes
+        if (counted_upvotes, counted_downvotes) != (upvotes, downvotes):
+            drift[pk] = (counted_upvotes - upvotes,
+                         counted_downvotes - downvotes)
+    return drift
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--dry-run', action='store_true', dest='dry_run',
+            default=False, help="Only report the drift, don't fix it."),
+        make_option('--batch-size', action='store', type='int',
+            dest='batch_size', default=1000,
+            help="How many VoteCounts to check at once. Default is 1000."),
+        make_option('--sleep', action='store', type='float', dest='sleep',
+            default=0, help="Seconds to pause between batches."),
+    )
+    help = "Recomputes the VoteCount totals from the Vote rows (plus the " \
+           "archived votes) and fixes the ones that drifted. Refuses to " \
+           "fix anything while VOTECOUNT_BUFFERED is on."
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        if vote_buffer.is_enabled() and not dry_run:
+            # Every vote still waiting in a buffer has its Vote row but
+            # isn't in the stored totals yet, so "fixing" it would count it
+            # twice once the buffer is flushed
+            raise CommandError("VOTECOUNT_BUFFERED is on, so votes still "
+                    "pending in the buffers would look like drift. Turn "
+                    "buffering off in every process and let the buffers "
+                    "flush first, or use --dry-run.")
+        batch_size = options['batch_size']
+
+        max_pk = VoteCount.objects.aggregate(max_pk=Max('pk'))['max_pk'] or 0
+        drifted = 0
+        for low in range(0, max_pk + 1, batch_size):
+            filters = dict(pk__gte=low, pk__lt=low + batch_size)
+            drift = find_drift(**filters)
+
+            if drift:
+                # A vote committed between reading the totals and counting
+                # the votes looks like drift, so check those rows again
+                recheck = find_drift(pk__in=list(drift))
+                drift = dict((pk, change) for pk, change in drift.items()
+                             if recheck.get(pk) == change)
+
+            for pk, (upvotes, downvotes) in sorted(drift.items()):
+                self.stdout.write("VoteCount %s: upvotes %+d, downvotes %+d"
+                                  % (pk, upvotes, downvotes))
+
+            if drift and not dry_run:
+                # The drift includes the counter shards, so it has to go
+                # where a vote would go, not straight to the VoteCount row
+                VoteCount.objects.adjust_many(
+                        VoteCount.objects.in_bulk(list(drift)), drift)
+
+            drifted += len(drift)
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        if dry_run:
+            self.stdout.write("%s VoteCounts have drifted." % drifted)
+        else:
+            self.stdout.write("Fixed %s VoteCounts." % drifted)
@@ -0,0 +1,59 @@
+from optparse import make_option
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+
+from voting import registry
+from voting.models import VoteCount
+
+
+class Command(BaseCommand):
+    args = '[app_label.model ...]'
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', action='store', type='int',
+            dest='batch_size', default=1000,
+            help="How many VoteCounts to copy at once. Default is 1000."),
+    )
+    help = "Copies the vote sums of the VoteCounts to the sum fields of the " \
+           "registered models (see voting.register), optionally only for " \
+           "the given models. Objects nobody voted on are left alone."
+
+    def handle(self, *labels, **options):
+        models = registry.get_registered()
+        if labels:
+            by_label = dict(('%s.%s' % (model._meta.app_label,
+                                        model._meta.model_name), model)
+                            for model in models)
+            try:
+                models = dict((by_label[label.lower()],
+                               models[by_label[label.lower()]])
+                              for label in labels)
+            except KeyError as e:
+                raise CommandError("%s isn't registered" % e.args[0])
+
+        for model, sum_field in models.items():
+            synced = self.sync(model, sum_field, options['batch_size'])
+            self.stdout.write("Synced %s %s objects." % (
+                              synced, model._meta.verbose_name))
+
+    def sync(self, model, sum_field, batch_size):
+        ct = ContentType.objects.get_for_model(model)
+        votecounts = VoteCount.objects.filter(content_type=ct)
+        max_pk = votecounts.aggregate(max_pk=Max('pk'))['max_pk'] or 0
+
+        synced = 0
+        for low in range(0, max_pk + 1, batch_size):
+            # Lock the VoteCounts so no vote changes a sum while it's copied
+            with transaction.atomic():
+                rows = votecounts.select_for_update() \
+                            .filter(pk__gte=low, pk__lt=low + batch_size) \
+                            .values_list('object_pk', 'vote_sum')
+                by_sum = {}
+                for object_pk, vote_sum in rows:
+                    by_sum.setdefault(vote_sum, []).append(object_pk)
+                for vote_sum, object_pks in by_sum.items():
+                    synced += model._base_manager.filter(
+                            pk__in=object_pks).update(**{sum_field: vote_sum})
+        return synced
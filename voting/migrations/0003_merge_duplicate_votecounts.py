@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+from voting.utils import merge_duplicate_votecounts
+
+
+def merge_duplicates(apps, schema_editor):
+    VoteCount = apps.get_model('voting', 'VoteCount')
+    Vote = apps.get_model('voting', 'Vote')
+    merge_duplicate_votecounts(VoteCount, Vote)
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0002_auto_20141024_1928'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, noop),
+    ]
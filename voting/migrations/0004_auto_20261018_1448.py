@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0003_merge_duplicate_votecounts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='votecount',
+            name='object_pk',
+            field=models.CharField(max_length=255, verbose_name=b'object ID'),
+            preserve_default=True,
+        ),
+        migrations.AlterUniqueTogether(
+            name='votecount',
+            unique_together=set([('content_type', 'object_pk')]),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0004_auto_20261018_1448'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteCountShard',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('shard', models.PositiveSmallIntegerField(editable=False)),
+                ('upvotes', models.IntegerField(default=0)),
+                ('downvotes', models.IntegerField(default=0)),
+                ('votecount', models.ForeignKey(related_name='shards', editable=False, to='voting.VoteCount')),
+            ],
+            options={
+                'verbose_name': 'Vote Count Shard',
+                'verbose_name_plural': 'Vote Count Shards',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='votecountshard',
+            unique_together=set([('votecount', 'shard')]),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0005_auto_20261018_1452'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteBucket',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('start', models.DateTimeField(editable=False)),
+                ('votes', models.IntegerField(default=0)),
+                ('votecount', models.ForeignKey(related_name='buckets', editable=False, to='voting.VoteCount')),
+            ],
+            options={
+                'get_latest_by': 'start',
+                'verbose_name': 'Vote Bucket',
+                'verbose_name_plural': 'Vote Buckets',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='votebucket',
+            unique_together=set([('votecount', 'start')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='vote',
+            index_together=set([('votecount', 'date_created')]),
+        ),
+    ]
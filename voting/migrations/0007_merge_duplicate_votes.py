@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+from voting.utils import merge_duplicate_votes
+
+
+def merge_duplicates(apps, schema_editor):
+    Vote = apps.get_model('voting', 'Vote')
+    VoteCount = apps.get_model('voting', 'VoteCount')
+    merge_duplicate_votes(Vote, VoteCount)
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0006_auto_20261018_1452'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, noop),
+    ]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0008_auto_20261018_1456'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='votecount',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='votecount',
+            name='hot_score',
+            field=models.FloatField(default=0, editable=False),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='votecount',
+            name='vote_sum',
+            field=models.IntegerField(default=0, editable=False),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='votecount',
+            name='wilson_score',
+            field=models.FloatField(default=0, editable=False),
+            preserve_default=True,
+        ),
+        migrations.AlterIndexTogether(
+            name='votecount',
+            index_together=set([('content_type', 'hot_score'), ('content_type', 'vote_sum'), ('content_type', 'wilson_score')]),
+        ),
+    ]
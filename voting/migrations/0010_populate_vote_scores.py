@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+from voting.models import hot_score, wilson_score
+
+
+def populate_scores(apps, schema_editor):
+    VoteCount = apps.get_model('voting', 'VoteCount')
+    rows = VoteCount.objects.values_list('pk', 'upvotes', 'downvotes',
+                                         'modified')
+    for pk, upvotes, downvotes, modified in rows.iterator():
+        # The creation date is unknown, the last vote is the best guess
+        VoteCount.objects.filter(pk=pk).update(
+                vote_sum=upvotes - downvotes,
+                wilson_score=wilson_score(upvotes, downvotes),
+                hot_score=hot_score(upvotes - downvotes, modified),
+                created=modified)
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0009_auto_20261018_1459'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_scores, noop),
+    ]
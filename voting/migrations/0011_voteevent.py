@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('voting', '0010_populate_vote_scores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteEvent',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, b'cast'), (2, b'changed'), (3, b'removed')])),
+                ('vote_pk', models.IntegerField()),
+                ('direction', models.SmallIntegerField()),
+                ('date_created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('votecount', models.ForeignKey(related_name='+', to='voting.VoteCount')),
+            ],
+            options={
+                'verbose_name': 'Vote Event',
+                'verbose_name_plural': 'Vote Events',
+            },
+            bases=(models.Model,),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0011_voteevent'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='vote',
+            options={'get_latest_by': 'date_created'},
+        ),
+        migrations.AlterField(
+            model_name='vote',
+            name='date_created',
+            field=models.DateTimeField(editable=False, db_index=True),
+            preserve_default=True,
+        ),
+        # Create the composite indexes before dropping the foreign key
+        # ones, MySQL needs an index on every foreign key
+        migrations.AlterIndexTogether(
+            name='vote',
+            index_together=set([('votecount', 'date_created'), ('votecount', 'user')]),
+        ),
+        migrations.AlterField(
+            model_name='vote',
+            name='user',
+            field=models.ForeignKey(editable=False, to=settings.AUTH_USER_MODEL, db_index=False),
+            preserve_default=True,
+        ),
+        migrations.AlterField(
+            model_name='vote',
+            name='votecount',
+            field=models.ForeignKey(editable=False, to='voting.VoteCount', db_index=False),
+            preserve_default=True,
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0012_auto_20261018_1504'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vote',
+            name='ip_packed',
+            field=models.BinaryField(null=True),
+            preserve_default=True,
+        ),
+        migrations.AlterField(
+            model_name='vote',
+            name='ip_address',
+            field=models.GenericIPAddressField(null=True, editable=False),
+            preserve_default=True,
+        ),
+    ]
@@ -1,8 +1,12 @@
+import calendar
 import datetime
+import math
+import random
 
-from django.db import models
+from django.db import models, connections, transaction, IntegrityError
 from django.conf import settings
-from django.db.models import F
+from django.core import signing
+from django.db.models import F, Q, Sum
 from django.utils import timezone
 
 from django.contrib.contenttypes.models import ContentType
@@ -11,16 +15,120 @@ from django.utils.encoding import force_text
 
 from django.dispatch import Signal
 
+from voting import aftercommit
+from voting import buffer as vote_buffer
+from voting import cache as vote_cache
+from voting import leaderboard
+from voting import registry
+from voting.utils import pack_ip, unpack_ip
+
 AUTH_USER_MODEL = getattr(settings, 'AUTH_USER_MODEL', 'auth.User')
 
 VOTE_DIRECTIONS = (('up', 1), ('down', -1))
 UPVOTE = 1
 DOWNVOTE = -1
 
+def get_shard_count(content_type_id):
+    '''
+    Returns how many counter shards (see VoteCountShard) the VoteCounts of a
+    content type use, as configured by VOTECOUNT_SHARDS, eg:
+
+        VOTECOUNT_SHARDS = {'news.article': 8}
+
+    Content types that aren't listed use just the VoteCount row (1).
+    '''
+    shards = getattr(settings, 'VOTECOUNT_SHARDS', None)
+    if not shards:
+        return 1
+    ct = ContentType.objects.get_for_id(content_type_id)
+    return shards.get('%s.%s' % (ct.app_label, ct.model), 1)
+
+# Salt of the signature of deferred VoteCount pks
+DEFERRED_PK_SALT = 'voting.deferred_pk'
+
+def buckets_enabled():
+    '''
+    With VOTECOUNT_VOTE_BUCKETS = True every vote is also counted in an
+    hourly VoteBucket, which VoteCount.votes_in_last() uses.
+    '''
+    return getattr(settings, 'VOTECOUNT_VOTE_BUCKETS', False)
+
+def floor_hour(value):
+    return value.replace(minute=0, second=0, microsecond=0)
+
+def outbox_enabled():
+    '''
+    With VOTECOUNT_OUTBOX = True every vote event is also appended to the
+    VoteEvent table, in the same transaction as the vote.
+    '''
+    return getattr(settings, 'VOTECOUNT_OUTBOX', False)
+
+def ip_fields(ip_address):
+    '''
+    Returns the Vote fields that store a voter's IP address: by default the
+    `ip_address` text, or with VOTECOUNT_PACKED_IP = True 16 packed bytes in
+    `ip_packed`, truncated to the network with VOTECOUNT_TRUNCATE_IP = True.
+    '''
+    if not getattr(settings, 'VOTECOUNT_PACKED_IP', False):
+        return {'ip_address': ip_address}
+    truncate = getattr(settings, 'VOTECOUNT_TRUNCATE_IP', False)
+    return {'ip_address': None,
+            'ip_packed': pack_ip(ip_address, truncate=truncate)}
+
+# SIGNALS #
+
+# Sent with sender=Vote and `votes`, a list of the Votes concerned, so batch
+# operations send one signal rather than one per vote.  They are sent inside
+# the vote's transaction.
+vote_cast = Signal(providing_args=['votes'])
+vote_changed = Signal(providing_args=['votes'])
+vote_removed = Signal(providing_args=['votes'])
+
+# SCORES #
+
+SCORE_FIELDS = {
+    'sum': 'vote_sum',
+    'wilson': 'wilson_score',
+    'hot': 'hot_score',
+}
+
+HOT_EPOCH = 1134028003      # The epoch of reddit's "hot" ranking
+HOT_DECAY = 45000.0         # 12.5 hours, ie, 10 net votes buy 12.5 hours
+
+def wilson_score(upvotes, downvotes, z=1.96):
+    '''
+    Lower bound of the Wilson score confidence interval (95% by default)
+    for the fraction of upvotes.  A few votes rank below many votes with
+    the same up/down ratio.
+    '''
+    n = upvotes + downvotes
+    if n <= 0:
+        return 0.0
+    phat = float(upvotes) / n
+    return (phat + z * z / (2 * n) -
+            z * math.sqrt((phat * (1 - phat) + z * z / (4 * n)) / n)) / \
+           (1 + z * z / n)
+
+def hot_score(vote_sum, created):
+    '''
+    Reddit's "hot" ranking: the order of magnitude of the vote sum plus a
+    bonus for newer objects.  The bonus doesn't change as time passes, so
+    the score only needs updating when the votes change.
+    '''
+    order = math.log10(max(abs(vote_sum), 1))
+    sign = 1 if vote_sum > 0 else -1 if vote_sum < 0 else 0
+    seconds = calendar.timegm(created.utctimetuple()) - HOT_EPOCH
+    return round(sign * order + seconds / HOT_DECAY, 7)
+
 # EXCEPTIONS #
 
 class DuplicateContentObject(Exception):
-    'If content_object already exists for this model'
+    '''
+    If content_object already exists for this model.
+
+    No longer raised: uniqueness is enforced by the database now (see
+    VoteCount.Meta.unique_together).  Kept so existing imports don't break.
+    '''
     pass
 
 class VoteCountManager(models.Manager):
@@ -40,6 +148,313 @@ class VoteCountManager(models.Manager):
         pk = force_text(obj._get_pk_val())
         return self.get_queryset().get(content_type=ct, object_pk=pk)
 
+    def get_for_objects(self, objects):
+        '''
+        Loads the VoteCounts for an iterable of objects with one `IN` query
+        per content type and returns them as a {obj.pk: VoteCount} dict.
+
+        Objects that don't have a VoteCount yet are left out.  The dict is
+        keyed by the objects' own pks, so they should all be of one model
+        (or at least have distinct pks).
+        '''
+        by_ctype = {}
+        for obj in objects:
+            ct = ContentType.objects.get_for_model(obj)
+            pk = obj._get_pk_val()
+            by_ctype.setdefault(ct, {})[force_text(pk)] = pk
+
+        votecounts = {}
+        for ct, pks in by_ctype.items():
+            qs = self.get_queryset().filter(content_type=ct,
+                                            object_pk__in=list(pks))
+            for votecount in qs:
+                votecounts[pks[votecount.object_pk]] = votecount
+        return votecounts
+
+    def get_totals(self, ctype, object_pk):
+        '''
+        Returns the (upvotes, downvotes) totals of an object, or (0, 0) if
+        nobody voted on it yet, without creating a VoteCount.
+
+        The totals are served from the vote cache if VOTECOUNT_CACHE is set
+        (see voting.cache).
+        '''
+        object_pk = force_text(object_pk)
+
+        def load():
+            qs = self.get_queryset().filter(content_type=ctype,
+                        object_pk=object_pk)
+            if get_shard_count(ctype.pk) > 1:
+                qs = qs.annotate(shard_upvotes=Sum('shards__upvotes'),
+                                 shard_downvotes=Sum('shards__downvotes'))
+                votecount = qs.first()
+                if votecount is None:
+                    return 0, 0
+                votecount._shard_totals = (votecount.shard_upvotes or 0,
+                                           votecount.shard_downvotes or 0)
+            else:
+                votecount = qs.first()
+                if votecount is None:
+                    return 0, 0
+            return votecount.current_totals()
+
+        return vote_cache.get_totals(ctype.pk, object_pk, load)
+
+    def deferred_pk(self, ctype, object_pk):
+        '''
+        Returns a "<content_type_id>:<object_pk>:<signature>" token that can
+        be posted to the vote view in place of the pk of a VoteCount that
+        hasn't been created yet (see get_for_vote_pk).
+
+        The token is signed, so clients can only vote on the objects they
+        were handed a token for, not on any row of any model.
+        '''
+        return signing.Signer(salt=DEFERRED_PK_SALT).sign(
+                '%s:%s' % (ctype.pk, force_text(object_pk)))
+
+    def parse_deferred_pk(self, vote_pk):
+        '''
+        Returns the (ContentType, object_pk) of a token from deferred_pk().
+        Raises VoteCount.DoesNotExist if the token was tampered with or its
+        content type is gone.
+        '''
+        try:
+            value = signing.Signer(salt=DEFERRED_PK_SALT).unsign(
+                    force_text(vote_pk))
+        except signing.BadSignature:
+            raise self.model.DoesNotExist("Invalid deferred VoteCount pk")
+        ctype_pk, object_pk = value.split(':', 1)
+        try:
+            ctype = ContentType.objects.get_for_id(int(ctype_pk))
+        except ContentType.DoesNotExist:
+            ctype = None
+        if ctype is None or ctype.model_class() is None:
+            raise self.model.DoesNotExist("Unknown content type")
+        return ctype, object_pk
+
+    def content_types_for_vote_pks(self, vote_pks):
+        '''
+        Returns a {vote_pk: content_type_id} map for `votecount_pk`s as
+        posted to the vote views (see get_for_vote_pk), without creating
+        any VoteCounts, eg to apply per content type rate limits first.
+        Raises VoteCount.DoesNotExist if any of them is unknown.
+        '''
+        vote_pks = [force_text(vote_pk) for vote_pk in vote_pks]
+        ctypes = {}
+        plain_pks = []
+        for vote_pk in vote_pks:
+            if ':' in vote_pk:
+                ctypes[vote_pk] = self.parse_deferred_pk(vote_pk)[0].pk
+            else:
+                plain_pks.append(vote_pk)
+        if plain_pks:
+            for pk, ctype_pk in self.get_queryset().filter(pk__in=plain_pks) \
+                                    .values_list('pk', 'content_type'):
+                ctypes[force_text(pk)] = ctype_pk
+        for vote_pk in vote_pks:
+            if vote_pk not in ctypes:
+                raise self.model.DoesNotExist("Unknown VoteCount %s" % vote_pk)
+        return ctypes
+
+    def get_for_vote_pk(self, vote_pk):
+        '''
+        Returns the VoteCount for a `votecount_pk` as posted to the vote view.
+        That's either a plain VoteCount pk, or a token from deferred_pk(),
+        in which case the VoteCount is created on this first vote (as long
+        as the object being voted on exists).
+        '''
+        vote_pk = force_text(vote_pk)
+        if ':' not in vote_pk:
+            return self.get_queryset().get(pk=vote_pk)
+
+        ctype, object_pk = self.parse_deferred_pk(vote_pk)
+        try:
+            return self.get_queryset().get(content_type=ctype,
+                                           object_pk=object_pk)
+        except self.model.DoesNotExist:
+            # Don't let anyone create counts for objects that don't exist
+            ctype.get_object_for_this_type(pk=object_pk)
+            votecount, created = self.get_or_create(content_type=ctype,
+                                                    object_pk=object_pk)
+            return votecount
+
+    def apply_changes(self, changes):
+        '''
+        Atomically applies a {votecount_pk: (upvotes, downvotes)} map of
+        changes to the totals.  VoteCounts with the same change (eg, one
+        upvote less) are updated together by one
+        `UPDATE ... WHERE id IN (...)` statement.
+
+        Returns the fresh {votecount_pk: (upvotes, downvotes)} totals of the
+        changed VoteCounts, whose scores (and registered sum fields, see
+        voting.registry) are updated as well.
+        '''
+        by_change = {}
+        for pk, (upvotes, downvotes) in changes.items():
+            if upvotes or downvotes:
+                by_change.setdefault((upvotes, downvotes), []).append(pk)
+        if not by_change:
+            return {}
+
+        now = timezone.now()
+        with transaction.atomic():
+            for (upvotes, downvotes), pks in by_change.items():
+                self.get_queryset().filter(pk__in=pks).update(
+                        upvotes=F('upvotes') + upvotes,
+                        downvotes=F('downvotes') + downvotes,
+                        vote_sum=F('vote_sum') + (upvotes - downvotes),
+                        modified=now)
+            rows = list(self.get_queryset().filter(
+                    pk__in=[pk for pks in by_change.values() for pk in pks])
+                    .values_list('pk', 'upvotes', 'downvotes', 'created',
+                                 'content_type', 'object_pk'))
+            self.update_scores([row[:4] for row in rows])
+
+            mirrored = {}
+            for pk, upvotes, downvotes, created, ctype_pk, object_pk in rows:
+                mirrored.setdefault(ctype_pk, {})[object_pk] = \
+                        changes[pk][0] - changes[pk][1]
+            for ctype_pk, object_changes in mirrored.items():
+                registry.mirror_changes(ctype_pk, object_changes)
+        return dict((row[0], (row[1], row[2])) for row in rows)
+
+    def record_archived(self, changes):
+        '''
+        Adds a {votecount_pk: (upvotes, downvotes)} map of votes deleted with
+        save_votecount=True to the archived totals, so rebuild_vote_counts
+        can tell them from drift.  Like apply_changes(), VoteCounts with the
+        same change are updated by one statement.
+        '''
+        by_change = {}
+        for pk, (upvotes, downvotes) in changes.items():
+            if upvotes or downvotes:
+                by_change.setdefault((upvotes, downvotes), []).append(pk)
+        for (upvotes, downvotes), pks in by_change.items():
+            self.get_queryset().filter(pk__in=pks).update(
+                    archived_upvotes=F('archived_upvotes') + upvotes,
+                    archived_downvotes=F('archived_downvotes') + downvotes)
+
+    def update_scores(self, rows):
+        '''
+        Stores the Wilson and hot scores for a list of
+        (pk, upvotes, downvotes, created) rows.  Each UPDATE only matches
+        while the row still has those totals, so a score computed from
+        stale totals can't overwrite the one of a newer vote.
+        '''
+        for pk, upvotes, downvotes, created in rows:
+            self.get_queryset().filter(pk=pk, upvotes=upvotes,
+                    downvotes=downvotes).update(
+                        wilson_score=wilson_score(upvotes, downvotes),
+                        hot_score=hot_score(upvotes - downvotes, created))
+
+    def top_for_model(self, model, by='hot', limit=10):
+        '''
+        Returns the `limit` VoteCounts of a model with the highest score,
+        where `by` is one of 'sum', 'wilson' or 'hot'.  The scores are
+        stored and indexed per content type, so this doesn't need to look
+        at any other rows.
+
+        Votes that are still pending in the vote buffer or in counter
+        shards only count once they are flushed or folded.
+        '''
+        if by not in SCORE_FIELDS:
+            raise ValueError("Unknown score %r, use one of: %s" % (by,
+                    ', '.join(sorted(SCORE_FIELDS))))
+        ct = ContentType.objects.get_for_model(model)
+        return self.get_queryset().filter(content_type=ct) \
+                    .order_by('-%s' % SCORE_FIELDS[by])[:limit]
+
+    def get_leaderboard(self, model, window='day', limit=None):
+        '''
+        Returns the VoteCounts of a model that gained the most net votes in
+        the current hour, day or week (`window`) from its cached leaderboard
+        (see voting.leaderboard), as a list of (VoteCount, net votes) pairs,
+        best first.  Only the VoteCounts themselves are loaded, by pk.
+        '''
+        ct = ContentType.objects.get_for_model(model)
+        top = leaderboard.get_top(ct.pk, window, limit)
+        votecounts = self.for_object(model).in_bulk([pk for pk, score in top])
+        return [(votecounts[pk], score) for pk, score in top
+                if pk in votecounts]
+
+    def adjust_many(self, votecounts, changes):
+        '''
+        Like VoteCount.adjust_totals() for many VoteCounts at once.
+        `votecounts` is a {pk: VoteCount} map, `changes` a
+        {pk: (upvotes, downvotes)} map.  The changes are applied with
+        apply_changes() and the VoteCounts refreshed with one query, except
+        for buffered or sharded totals, which go through adjust_totals().
+        '''
+        plain = {}
+        for pk, (upvotes, downvotes) in changes.items():
+            votecount = votecounts[pk]
+            if vote_buffer.is_enabled() or \
+                    get_shard_count(votecount.content_type_id) > 1:
+                votecount.adjust_totals(upvotes=upvotes, downvotes=downvotes)
+            else:
+                plain[pk] = (upvotes, downvotes)
+                votecount.record_changes(upvotes, downvotes)
+        if not plain:
+            return
+
+        now = timezone.now()
+        for pk, (upvotes, downvotes) in self.apply_changes(plain).items():
+            votecounts[pk].upvotes = upvotes
+            votecounts[pk].downvotes = downvotes
+            votecounts[pk].modified = now
+            votecounts[pk].compute_scores()
+
+    def increment(self, pk, upvotes=0, downvotes=0):
+        '''
+        Atomically adds `upvotes` and `downvotes` (either may be negative) to
+        the totals of the VoteCount with the given pk.
+
+        The change is applied as a single `UPDATE ... SET upvotes = upvotes + 1`
+        statement so concurrent votes on the same object can't overwrite each
+        other the way a read-modify-write of the model instance would.
+
+        Returns the fresh (upvotes, downvotes) totals.  On PostgreSQL they
+        come straight from the UPDATE (`RETURNING`), elsewhere they are read
+        back with one more query.  The scores are updated from them, and
+        the object's sum field if its model is registered (see
+        voting.registry).
+        '''
+        connection = connections[self.db]
+        if connection.vendor == 'postgresql':
+            qn = connection.ops.quote_name
+            cursor = connection.cursor()
+            cursor.execute(
+                'UPDATE %(table)s SET %(up)s = %(up)s + %%s, '
+                '%(down)s = %(down)s + %%s, %(sum)s = %(sum)s + %%s, '
+                '%(modified)s = %%s WHERE %(pk)s = %%s '
+                'RETURNING %(up)s, %(down)s, %(created)s, %(ctype)s, '
+                '%(object_pk)s' % {
+                    'table': qn(self.model._meta.db_table),
+                    'up': qn('upvotes'), 'down': qn('downvotes'),
+                    'sum': qn('vote_sum'), 'modified': qn('modified'),
+                    'created': qn('created'),
+                    'ctype': qn('content_type_id'),
+                    'object_pk': qn('object_pk'),
+                    'pk': qn(self.model._meta.pk.column)},
+                [upvotes, downvotes, upvotes - downvotes, timezone.now(),
+                 pk])
+            row = cursor.fetchone()
+            if row is None:
+                raise self.model.DoesNotExist
+            new_upvotes, new_downvotes, created, ctype_pk, object_pk = row
+        else:
+            qs = self.get_queryset().filter(pk=pk)
+            qs.update(upvotes=F('upvotes') + upvotes,
+                      downvotes=F('downvotes') + downvotes,
+                      vote_sum=F('vote_sum') + (upvotes - downvotes),
+                      modified=timezone.now())
+            new_upvotes, new_downvotes, created, ctype_pk, object_pk = \
+                    qs.values_list('upvotes', 'downvotes', 'created',
+                                   'content_type', 'object_pk').get()
+        self.update_scores([(pk, new_upvotes, new_downvotes, created)])
+        registry.mirror_changes(ctype_pk, {object_pk: upvotes - downvotes})
+        return new_upvotes, new_downvotes
+
 # MODELS #
 
 class VoteCount(models.Model):
@@ -52,20 +467,37 @@ class VoteCount(models.Model):
     
     upvotes = models.PositiveIntegerField(default=0)
     downvotes = models.PositiveIntegerField(default=0)
+    # Stored (rather than computed) so that VoteCounts can be ordered by
+    # them in SQL, see VoteCountManager.top_for_model().  They are updated
+    # along with the totals.
+    vote_sum = models.IntegerField(default=0, editable=False)
+    wilson_score = models.FloatField(default=0, editable=False)
+    hot_score = models.FloatField(default=0, editable=False)
+    # The votes deleted with save_votecount=True (eg by archive_votes),
+    # which are still in the totals but have no Vote rows any more
+    archived_upvotes = models.PositiveIntegerField(default=0, editable=False)
+    archived_downvotes = models.PositiveIntegerField(default=0,
+                                                     editable=False)
+    created = models.DateTimeField(default=timezone.now, editable=False)
     modified = models.DateTimeField(default=timezone.now)
     content_type = models.ForeignKey(ContentType,
                         verbose_name="content type",
                         related_name="content_type_set_for_%(class)s",)
-    object_pk = models.TextField('object ID')
+    # A bounded CharField (rather than a TextField) so that the
+    # (content_type, object_pk) pair can be indexed and kept unique.  It
+    # still holds *any* primary key type (integer or text).
+    object_pk = models.CharField('object ID', max_length=255)
     content_object = generic.GenericForeignKey('content_type', 'object_pk')
-    
-    @property
-    def vote_sum(self):
-        return self.upvotes - self.downvotes
 
     class Meta:
-        #ordering = ( '-vote_sum', )    # TODO: Ordering is not free, so should we really include this?
-        #unique_together = (("content_type", "object_pk"),)
+        # No default ordering, it isn't free.  Use top_for_model() or order
+        # by one of the (indexed) scores explicitly.
+        unique_together = (("content_type", "object_pk"),)
+        index_together = (
+            ("content_type", "vote_sum"),
+            ("content_type", "wilson_score"),
+            ("content_type", "hot_score"),
+        )
         get_latest_by = 'modified'
         #db_table = 'votecount_vote_count'
         verbose_name = 'Vote Count'
@@ -76,24 +508,104 @@ class VoteCount(models.Model):
 
     def save(self, *args, **kwargs):
         self.modified = timezone.now()
+        self.compute_scores()
+        super(VoteCount, self).save(*args, **kwargs)
 
-        if not self.pk and self.object_pk and self.content_type:
-            # Because we are using a models.TextField() for `object_pk` to
-            # allow *any* primary key type (integer or text), we
-            # can't use `unique_together` or `unique=True` to gaurantee
-            # that only one VoteCount object exists for a given object.
-            #
-            # This is just a simple hack - if there is no `self.pk`
-            # set, it checks the database once to see if the `content_type`
-            # and `object_pk` exist together (uniqueness).  Obviously, this
-            # is not fool proof - if someone sets their own `id` or `pk` 
-            # when initializing the VoteCount object, we could get a duplicate.
-            if VoteCount.objects.filter(
-                    object_pk=self.object_pk).filter(content_type=self.content_type):
-                raise DuplicateContentObject, "A VoteCount object already " + \
-                        "exists for this content_object."
+    def compute_scores(self):
+        '''
+        Sets vote_sum and the scores from this instance's totals.
+        '''
+        self.vote_sum = self.upvotes - self.downvotes
+        self.wilson_score = wilson_score(self.upvotes, self.downvotes)
+        self.hot_score = hot_score(self.vote_sum, self.created)
 
-        super(VoteCount, self).save(*args, **kwargs)
+    def adjust_totals(self, upvotes=0, downvotes=0):
+        '''
+        Atomically changes the up/downvote totals in the database (see
+        VoteCountManager.increment) and refreshes this instance with the
+        fresh totals, so there is no need to reload it afterwards.
+
+        With VOTECOUNT_BUFFERED = True the change is only added to the vote
+        buffer (see voting.buffer) and written to the database later; the
+        instance keeps its persisted totals, current_totals() includes the
+        pending change.  Likewise, for content types with VOTECOUNT_SHARDS
+        the change goes to a random counter shard (see VoteCountShard).
+
+        The buffer and cache only get the change once the vote's
+        transaction commits (see voting.aftercommit).  The leaderboards are
+        left to the callers, which know when the votes were cast.
+        '''
+        shards = get_shard_count(self.content_type_id)
+        if vote_buffer.is_enabled():
+            aftercommit.defer(vote_buffer.add, self.pk, upvotes=upvotes,
+                              downvotes=downvotes)
+        elif shards > 1:
+            VoteCountShard.objects.increment(self.pk, random.randrange(shards),
+                    upvotes=upvotes, downvotes=downvotes)
+            self.__dict__.pop('_shard_totals', None)
+        else:
+            self.upvotes, self.downvotes = VoteCount.objects.increment(
+                    self.pk, upvotes=upvotes, downvotes=downvotes)
+            self.modified = timezone.now()
+            self.compute_scores()
+        self.record_changes(upvotes, downvotes)
+
+    def record_changes(self, upvotes, downvotes):
+        '''
+        Passes a change of the totals on to the vote cache once the
+        transaction commits.  Until then the cached totals are marked dirty,
+        so a read can't cache the new totals before the change is added to
+        them.
+        '''
+        vote_cache.mark_dirty(self.content_type_id, self.object_pk)
+        aftercommit.defer(vote_cache.incr_totals, self.content_type_id,
+                          self.object_pk, upvotes=upvotes, downvotes=downvotes)
+
+    def current_totals(self):
+        '''
+        Returns the (upvotes, downvotes) totals including the counter shards
+        (see VoteCountShard) and any changes that are still pending in the
+        vote buffer (see voting.buffer).
+        '''
+        upvotes, downvotes = self.upvotes, self.downvotes
+        if get_shard_count(self.content_type_id) > 1:
+            shard_upvotes, shard_downvotes = self.get_shard_totals()
+            upvotes += shard_upvotes
+            downvotes += shard_downvotes
+        pending_upvotes, pending_downvotes = vote_buffer.get_pending(self.pk)
+        return upvotes + pending_upvotes, downvotes + pending_downvotes
+
+    def get_shard_totals(self):
+        '''
+        Returns the (upvotes, downvotes) totals of the counter shards that
+        haven't been folded into this row yet.  They are summed up with one
+        query and cached on the instance.
+        '''
+        if not hasattr(self, '_shard_totals'):
+            totals = self.shards.aggregate(upvotes=Sum('upvotes'),
+                                           downvotes=Sum('downvotes'))
+            self._shard_totals = (totals['upvotes'] or 0,
+                                  totals['downvotes'] or 0)
+        return self._shard_totals
+
+    def fold_shards(self):
+        '''
+        Moves the totals of the counter shards into this row and resets the
+        shards.  The shards are locked while that happens, so no votes are
+        lost.
+        '''
+        with transaction.atomic():
+            shards = list(self.shards.select_for_update())
+            upvotes = sum(shard.upvotes for shard in shards)
+            downvotes = sum(shard.downvotes for shard in shards)
+            if not upvotes and not downvotes:
+                return
+            VoteCountShard.objects.filter(pk__in=[s.pk for s in shards]) \
+                    .update(upvotes=0, downvotes=0)
+            self.upvotes, self.downvotes = VoteCount.objects.increment(
+                    self.pk, upvotes=upvotes, downvotes=downvotes)
+            self.compute_scores()
+            self._shard_totals = (0, 0)
 
     # TODO: Add kwarg for specifying if we want count for upvotes, downvotes, or all votes
     def votes_in_last(self, **kwargs):
@@ -102,9 +614,14 @@ class VoteCount(models.Model):
         IS NOT THE VOTE SUM, just the number of votes cast (upvote OR downvote).
 
         This will only work for as long as votes are saved in the Vote database.
-        If you are purging your database after 45 days, for example, that means
+        If you are purging your database after 45 days (see the archive_votes
+        command), for example, that means
         that asking for votes in the last 60 days will return an incorrect
         number as that the longest period it can search will be 45 days.
+
+        Unless VOTECOUNT_VOTE_BUCKETS = True: then the votes are counted from
+        hourly VoteBuckets, which survive purging the Vote rows.  Only the
+        first, partial hour of the period is counted from the Vote rows.
         
         For example: votes_in_last(days=7).
 
@@ -113,7 +630,20 @@ class VoteCount(models.Model):
         '''
         assert kwargs, "Must provide at least one timedelta arg (eg, days=1)"
         period = timezone.now() - datetime.timedelta(**kwargs)
-        return self.vote_set.filter(date_created__gte=period).count()
+        if not buckets_enabled():
+            return self.vote_set.filter(date_created__gte=period).count()
+
+        # Whole hours come from the VoteBuckets, only the part of the first
+        # hour that falls into the period is counted from the Vote rows
+        boundary = floor_hour(period)
+        if boundary < period:
+            boundary += datetime.timedelta(hours=1)
+        votes = self.buckets.filter(start__gte=boundary) \
+                    .aggregate(votes=Sum('votes'))['votes'] or 0
+        if boundary > period:
+            votes += self.vote_set.filter(date_created__gte=period,
+                                          date_created__lt=boundary).count()
+        return votes
 
     def get_content_object_url(self):
         '''
@@ -122,6 +652,146 @@ class VoteCount(models.Model):
         '''
         pass
         
+# How each backend casts an integer pk to text, to compare it with
+# VoteCount.object_pk
+PK_CASTS = {
+    'postgresql': 'CAST(%s AS varchar)',
+    'mysql': 'CAST(%s AS char)',
+    'oracle': 'TO_CHAR(%s)',
+}
+
+def with_vote_counts(queryset):
+    '''
+    Adds the `upvotes`, `downvotes` and `vote_sum` of each object to a
+    queryset of any model, as correlated subqueries, so objects and totals
+    are loaded with one query and can be ordered by in SQL, eg:
+
+        with_vote_counts(Article.objects.all()).order_by('-vote_sum')
+
+    Objects nobody voted on get 0.  The totals are the stored ones, ie
+    without votes still pending in the vote buffer or counter shards.
+
+    The object's pk is cast to text (rather than object_pk to the pk's type)
+    so the lookup uses VoteCount's (content_type, object_pk) index.
+    '''
+    model = queryset.model
+    connection = connections[queryset.db]
+    qn = connection.ops.quote_name
+    ct = ContentType.objects.get_for_model(model)
+
+    pk = '%s.%s' % (qn(model._meta.db_table), qn(model._meta.pk.column))
+    if model._meta.pk.get_internal_type() not in ('CharField', 'TextField',
+                                                  'SlugField'):
+        pk = PK_CASTS.get(connection.vendor, 'CAST(%s AS text)') % pk
+
+    table = qn(VoteCount._meta.db_table)
+    select = {}
+    for field in ('upvotes', 'downvotes', 'vote_sum'):
+        select[field] = 'COALESCE((SELECT %(table)s.%(field)s ' \
+                'FROM %(table)s WHERE %(table)s.%(ctype)s = %%s ' \
+                'AND %(table)s.%(object_pk)s = %(pk)s), 0)' % {
+                    'table': table,
+                    'field': qn(field),
+                    'ctype': qn('content_type_id'),
+                    'object_pk': qn('object_pk'),
+                    'pk': pk}
+    return queryset.extra(select=select,
+                          select_params=(ct.pk, ct.pk, ct.pk))
+
+class VoteCountShardManager(models.Manager):
+    def increment(self, votecount_pk, shard, upvotes=0, downvotes=0):
+        '''
+        Atomically adds `upvotes` and `downvotes` to one counter shard of a
+        VoteCount, creating the shard on its first vote.
+        '''
+        qs = self.get_queryset().filter(votecount=votecount_pk, shard=shard)
+        changes = dict(upvotes=F('upvotes') + upvotes,
+                       downvotes=F('downvotes') + downvotes)
+        if qs.update(**changes):
+            return
+        try:
+            with transaction.atomic():
+                self.create(votecount_id=votecount_pk, shard=shard,
+                            upvotes=upvotes, downvotes=downvotes)
+        except IntegrityError:
+            # A concurrent vote created it in the meantime
+            qs.update(**changes)
+
+class VoteCountShard(models.Model):
+    '''
+    One of several counter rows a VoteCount's totals can be spread over (see
+    VOTECOUNT_SHARDS).  Every vote updates a random shard instead of the
+    VoteCount row itself, so objects that get lots of votes at once don't
+    serialize on a single row lock.
+
+    The real totals are the VoteCount's plus the sum of its shards (see
+    VoteCount.current_totals).  `manage.py fold_vote_count_shards` moves
+    the shard totals back into the VoteCount rows.
+    '''
+
+    objects = VoteCountShardManager()
+
+    votecount = models.ForeignKey(VoteCount, related_name='shards',
+                                  editable=False)
+    shard = models.PositiveSmallIntegerField(editable=False)
+    # Not positive: a vote may be withdrawn on another shard than it was
+    # cast on
+    upvotes = models.IntegerField(default=0)
+    downvotes = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = (("votecount", "shard"),)
+        verbose_name = 'Vote Count Shard'
+        verbose_name_plural = 'Vote Count Shards'
+
+    def __unicode__(self):
+        return u'%s (shard %s)' % (self.votecount, self.shard)
+
+class VoteBucketManager(models.Manager):
+    def increment(self, votecount_pk, start, votes=1):
+        '''
+        Atomically adds `votes` (which may be negative) to the bucket of a
+        VoteCount that starts at `start`, creating the bucket if needed.
+        '''
+        qs = self.get_queryset().filter(votecount=votecount_pk, start=start)
+        if qs.update(votes=F('votes') + votes):
+            return
+        try:
+            with transaction.atomic():
+                self.create(votecount_id=votecount_pk, start=start,
+                            votes=votes)
+        except IntegrityError:
+            # A concurrent vote created it in the meantime
+            qs.update(votes=F('votes') + votes)
+
+class VoteBucket(models.Model):
+    '''
+    Number of votes cast on an object during one hour, kept up to date by
+    Vote.save()/delete() if VOTECOUNT_VOTE_BUCKETS = True (and filled in
+    for older votes by the rebuild_vote_buckets command).  Lets
+    VoteCount.votes_in_last() sum up a few rows instead of counting all the
+    object's votes, and keeps working after old Vote rows are purged.
+    '''
+
+    objects = VoteBucketManager()
+
+    votecount = models.ForeignKey(VoteCount, related_name='buckets',
+                                  editable=False)
+    start = models.DateTimeField(editable=False)
+    votes = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = (("votecount", "start"),)
+        get_latest_by = 'start'
+        verbose_name = 'Vote Bucket'
+        verbose_name_plural = 'Vote Buckets'
+
+    def __unicode__(self):
+        return u'%s (%s)' % (self.votecount, self.start)
+
+# How many votes bulk_delete_votes() deletes per query
+DELETE_BATCH_SIZE = 500
+
 class VoteManager(models.Manager):
     def for_votecount(self, votecount):
         """
@@ -132,6 +802,267 @@ class VoteManager(models.Manager):
             qs = qs.filter(votecount=votecount)
         return qs
 
+    def bulk_delete_votes(self, queryset=None, save_votecount=False):
+        '''
+        Deletes a queryset of votes (all votes by default) with a handful of
+        set-based queries instead of one delete() per vote: the votes are
+        locked and read with one query, the change to the totals is applied
+        with VoteCountManager.adjust_many (one UPDATE per distinct change),
+        and then exactly those votes are deleted with a DELETE per
+        DELETE_BATCH_SIZE votes, all in one transaction.
+
+        With save_votecount=True the VoteCount totals (and VoteBuckets) are
+        preserved and the votes added to the archived totals, like
+        Vote.delete(save_votecount=True).  Otherwise vote_removed is sent
+        for the deleted votes, which are only loaded if there are receivers
+        or an outbox.
+
+        Returns the number of votes deleted.
+        '''
+        if queryset is None:
+            queryset = self.get_queryset()
+
+        with aftercommit.atomic():
+            # Locked, so a concurrent cast_vote() can't withdraw one of them
+            # (and take it off the totals) before they are deleted here
+            rows = list(queryset.order_by().select_for_update().values_list(
+                    'pk', 'votecount', 'direction', 'date_created'))
+            pks = [row[0] for row in rows]
+            batches = [pks[i:i + DELETE_BATCH_SIZE]
+                       for i in range(0, len(pks), DELETE_BATCH_SIZE)]
+
+            changes = {}
+            for pk, votecount_pk, direction, date_created in rows:
+                totals = changes.setdefault(votecount_pk, [0, 0])
+                if direction == UPVOTE:
+                    totals[0] -= 1
+                else:
+                    totals[1] -= 1
+            votecounts = {}
+            votecount_pks = list(changes)
+            for i in range(0, len(votecount_pks), DELETE_BATCH_SIZE):
+                votecounts.update(VoteCount.objects.in_bulk(
+                        votecount_pks[i:i + DELETE_BATCH_SIZE]))
+
+            if save_votecount:
+                VoteCount.objects.record_archived(dict(
+                        (pk, (-upvotes, -downvotes))
+                        for pk, (upvotes, downvotes) in changes.items()))
+            else:
+                # Like single deletes, so the changes go to the counter
+                # shards or the vote buffer where those are used
+                VoteCount.objects.adjust_many(votecounts, changes)
+
+                if buckets_enabled():
+                    buckets = {}
+                    for pk, votecount_pk, direction, date_created in rows:
+                        key = (votecount_pk, floor_hour(date_created))
+                        buckets[key] = buckets.get(key, 0) - 1
+                    for (votecount_pk, start), votes in buckets.items():
+                        VoteBucket.objects.increment(votecount_pk, start,
+                                                     votes=votes)
+
+                if wants_events(vote_removed):
+                    send_vote_events(vote_removed, [vote for batch in batches
+                            for vote in self.get_queryset().filter(
+                                pk__in=batch)])
+
+            if leaderboard.is_enabled():
+                # The boards count the votes cast in their period, so drop
+                # the ones that lost some; they're rebuilt on the next read
+                week = leaderboard.period_start('week')
+                ctype_pks = set(votecounts[votecount_pk].content_type_id
+                                for pk, votecount_pk, direction, date_created
+                                in rows if date_created >= week)
+                for ctype_pk in ctype_pks:
+                    aftercommit.defer(leaderboard.drop, ctype_pk)
+
+            for batch in batches:
+                self.get_queryset().filter(pk__in=batch).delete()
+        return len(rows)
+
+    def directions_for_user(self, user, objects):
+        '''
+        Returns a {obj.pk: direction} map of the votes `user` cast on a list
+        of objects (of any models), with one query.  Objects the user didn't
+        vote on are left out.
+        '''
+        by_ctype = {}
+        for obj in objects:
+            ct = ContentType.objects.get_for_model(obj)
+            pk = obj._get_pk_val()
+            by_ctype.setdefault(ct.pk, {})[force_text(pk)] = pk
+        if not by_ctype or not user.is_authenticated():
+            return {}
+
+        lookup = Q()
+        for ctype_pk, pks in by_ctype.items():
+            lookup |= Q(votecount__content_type=ctype_pk,
+                        votecount__object_pk__in=list(pks))
+        rows = self.get_queryset().filter(lookup, user=user).order_by() \
+                    .values_list('votecount__content_type',
+                                 'votecount__object_pk', 'direction')
+        return dict((by_ctype[ctype_pk][object_pk], direction)
+                    for ctype_pk, object_pk, direction in rows)
+
+    def cast_votes(self, user, votes, ip_address):
+        '''
+        Registers a batch of votes by `user`, given as (votecount_pk,
+        direction) pairs, as if cast_vote() was called for each of them in
+        order.  The pks may be deferred pks (see
+        VoteCountManager.get_for_vote_pk).
+
+        Instead of a handful of queries per vote, this loads all VoteCounts
+        and the user's existing votes with one query each, then works out
+        each object's final vote and applies the differences in one
+        transaction: one INSERT for the new votes, one DELETE for the
+        withdrawn ones, one UPDATE per direction for the flipped ones, and
+        the set-based counter updates of VoteCountManager.adjust_many.
+        vote_cast, vote_changed and vote_removed are sent once each, for
+        all votes of the batch they concern.
+
+        Returns a list of (votecount, direction, net_change) tuples, one per
+        VoteCount in the order they first appear in `votes`; direction is
+        the user's vote after the batch (0 for none).  Raises
+        VoteCount.DoesNotExist if any of the pks is unknown, and
+        IntegrityError if a concurrent request registered the user's vote on
+        one of the objects first; nothing is changed then.
+        '''
+        votes = [(force_text(vote_pk), direction) for vote_pk, direction in votes]
+        vote_pks = []
+        for vote_pk, direction in votes:
+            if vote_pk not in vote_pks:
+                vote_pks.append(vote_pk)
+
+        votecounts = {}
+        plain_pks = [pk for pk in vote_pks if ':' not in pk]
+        for votecount in VoteCount.objects.filter(pk__in=plain_pks):
+            votecounts[force_text(votecount.pk)] = votecount
+        for vote_pk in vote_pks:
+            if vote_pk not in votecounts:
+                votecounts[vote_pk] = VoteCount.objects.get_for_vote_pk(vote_pk)
+        by_pk = dict((votecount.pk, votecount)
+                     for votecount in votecounts.values())
+
+        with aftercommit.atomic():
+            existing = dict((vote.votecount_id, vote) for vote in
+                            self.get_queryset().select_for_update().filter(
+                                user=user, votecount__in=list(by_pk)))
+
+            # Replay the votes in memory to get each object's final vote
+            initial = dict((pk, vote.direction)
+                           for pk, vote in existing.items())
+            final = dict(initial)
+            for vote_pk, direction in votes:
+                pk = votecounts[vote_pk].pk
+                final[pk] = 0 if final.get(pk) == direction else direction
+
+            now = timezone.now()
+            new_votes, withdrawn, flipped = [], [], {UPVOTE: [], DOWNVOTE: []}
+            changes, buckets = {}, {}
+            for pk, direction in final.items():
+                vote = existing.get(pk)
+                previous = vote.direction if vote else 0
+                if direction == previous:
+                    continue
+                if vote is None:
+                    new_votes.append(self.model(user=user, votecount_id=pk,
+                            direction=direction, date_created=now,
+                            **ip_fields(ip_address)))
+                    bucket = (pk, floor_hour(now))
+                    buckets[bucket] = buckets.get(bucket, 0) + 1
+                elif not direction:
+                    withdrawn.append(vote.pk)
+                    bucket = (pk, floor_hour(vote.date_created))
+                    buckets[bucket] = buckets.get(bucket, 0) - 1
+                else:
+                    flipped[direction].append(vote.pk)
+                changes[pk] = (int(direction == UPVOTE) - int(previous == UPVOTE),
+                               int(direction == DOWNVOTE) - int(previous == DOWNVOTE))
+                record_on_leaderboards(by_pk[pk], direction - previous,
+                                       vote.date_created if vote else now)
+
+            if new_votes:
+                # The user's missing votes can't be locked, so a concurrent
+                # request may insert one first: that's an IntegrityError,
+                # which rolls the whole batch back
+                self.bulk_create(new_votes)
+            if withdrawn:
+                self.get_queryset().filter(pk__in=withdrawn).delete()
+            for direction, pks in flipped.items():
+                if pks:
+                    self.get_queryset().filter(pk__in=pks) \
+                            .update(direction=direction)
+            VoteCount.objects.adjust_many(by_pk, changes)
+            if buckets_enabled():
+                for (pk, start), count in buckets.items():
+                    if count:
+                        VoteBucket.objects.increment(pk, start, votes=count)
+
+            if new_votes and wants_events(vote_cast):
+                # bulk_create() doesn't set the pks
+                new_votes = list(self.get_queryset().filter(user=user,
+                        votecount__in=[new_vote.votecount_id
+                                       for new_vote in new_votes]))
+                send_vote_events(vote_cast, new_votes)
+            changed = []
+            for vote in existing.values():
+                if vote.pk in flipped.get(final[vote.votecount_id], ()):
+                    vote.direction = final[vote.votecount_id]
+                    changed.append(vote)
+            send_vote_events(vote_changed, changed)
+            send_vote_events(vote_removed, [vote for vote in existing.values()
+                                            if vote.pk in withdrawn])
+
+        results = []
+        for vote_pk in vote_pks:
+            votecount = votecounts[vote_pk]
+            previous = initial.get(votecount.pk, 0)
+            direction = final[votecount.pk]
+            results.append((votecount, direction, direction - previous))
+        return results
+
+    def cast_vote(self, user, votecount, direction, ip_address):
+        '''
+        Registers a vote by `user` on `votecount`:
+
+        - If the user hasn't voted yet, a new Vote is created.
+        - If the user already voted in the same direction, the vote is
+          withdrawn (deleted).
+        - If the user already voted in the other direction, the existing
+          vote is flipped in place (see Vote.change_direction).
+
+        Everything happens in one transaction and `votecount` is refreshed
+        with the fresh totals.
+
+        Returns a (vote, net_change) tuple, where vote is None if the vote
+        was withdrawn and net_change is the change of the vote sum.
+        '''
+        with aftercommit.atomic():
+            try:
+                # Locked, so concurrent requests for the same vote (eg, a
+                # double click) take turns instead of both withdrawing it
+                vote = self.get_queryset().select_for_update() \
+                            .get(user=user, votecount=votecount)
+            except self.model.DoesNotExist:
+                vote = self.model(user=user, votecount=votecount,
+                                  direction=direction,
+                                  **ip_fields(ip_address))
+                try:
+                    vote.save()
+                except IntegrityError:
+                    # A concurrent request (eg, a double click) registered
+                    # the user's vote first
+                    return None, 0
+                return vote, direction
+
+            # Share the caller's VoteCount so it sees the refreshed totals
+            vote.votecount = votecount
+            if vote.direction == direction:
+                vote.delete()
+                return None, -direction
+            return vote, vote.change_direction(direction)
+
 class Vote(models.Model):
     '''
     Model captures a single Vote by a user.
@@ -141,48 +1072,215 @@ class Vote(models.Model):
     
     objects = VoteManager()
     
-    user = models.ForeignKey(AUTH_USER_MODEL, editable=False)
-    votecount = models.ForeignKey(VoteCount, editable=False)
+    # The foreign keys are covered by the indexes in Meta, they don't need
+    # their own
+    user = models.ForeignKey(AUTH_USER_MODEL, editable=False, db_index=False)
+    votecount = models.ForeignKey(VoteCount, editable=False, db_index=False)
+    # An IntegerField, so no install has to rewrite its Vote table; see the
+    # README for shrinking the column by hand
     direction = models.IntegerField(choices=VOTE_DIRECTIONS)
-    ip_address = models.GenericIPAddressField(editable=False)
-    date_created = models.DateTimeField(editable=False)
+    # Either of these, see ip_fields() and the `ip` property
+    ip_address = models.GenericIPAddressField(editable=False, null=True)
+    ip_packed = models.BinaryField(null=True)
+    # For purging old votes (see the archive_votes command)
+    date_created = models.DateTimeField(editable=False, db_index=True)
 
     class Meta:
-        ordering = ( '-date_created', )    
+        # No default ordering: sorting every query that touches votes isn't
+        # free, so order explicitly where it matters.
         get_latest_by = 'date_created'
+        # One vote per user and object, which also indexes the lookup of a
+        # user's vote
+        unique_together = (("user", "votecount"),)
+        index_together = (
+            # The votes on an object, eg for deleting them
+            ("votecount", "user"),
+            # For VoteCount.votes_in_last()
+            ("votecount", "date_created"),
+        )
         
     def __unicode__(self):
-        vote_type = 'Upvote' if self.type == UPVOTE else 'Downvote'
-        return vote_type + ' by ' + str(self.user)
+        vote_type = 'Upvote' if self.direction == UPVOTE else 'Downvote'
+        return u'%s by %s' % (vote_type, self.user)
+
+    @property
+    def ip(self):
+        '''
+        The voter's IP address, however it is stored.
+        '''
+        if self.ip_packed is not None:
+            return unpack_ip(self.ip_packed)
+        return self.ip_address
 
     def save(self, *args, **kwargs):
         '''
         The first time the object is created and saved, we set
-        the date_created field.
+        the date_created field (and send vote_cast).
         '''
-        if not self.date_created:
-            if self.direction == UPVOTE:
-                self.votecount.upvotes += 1
-            else:
-                self.votecount.downvotes += 1
-            self.votecount.save()
-            self.date_created = timezone.now()
+        with aftercommit.atomic():
+            created = not self.date_created
+            if created:
+                self.date_created = timezone.now()
+
+            # Insert first: if the vote clashes with one a concurrent request
+            # registered (IntegrityError), nothing has touched the totals,
+            # the cache or the vote buffer yet
+            try:
+                super(Vote, self).save(*args, **kwargs)
+            except IntegrityError:
+                if created:
+                    self.date_created = None
+                raise
+
+            if created:
+                if self.direction == UPVOTE:
+                    self.votecount.adjust_totals(upvotes=1)
+                else:
+                    self.votecount.adjust_totals(downvotes=1)
+                if buckets_enabled():
+                    VoteBucket.objects.increment(self.votecount_id,
+                            floor_hour(self.date_created))
+                record_on_leaderboards(self.votecount, self.direction,
+                                       self.date_created)
+                send_vote_events(vote_cast, [self])
+
+    def change_direction(self, direction):
+        '''
+        Flips an existing vote to `direction` in place, using one UPDATE for
+        this row and one atomic UPDATE that moves the vote between the
+        VoteCount's upvote and downvote totals.
+
+        The row is only changed if it still has the direction we loaded, so
+        two concurrent flips can't both move the totals.
 
-        super(Vote, self).save(*args, **kwargs)
+        Returns the net change of the vote sum.
+        '''
+        if direction == self.direction:
+            return 0
+
+        with aftercommit.atomic():
+            updated = Vote.objects.filter(pk=self.pk,
+                    direction=self.direction).update(direction=direction)
+            if not updated:
+                return 0
+            if direction == UPVOTE:
+                self.votecount.adjust_totals(upvotes=1, downvotes=-1)
+            else:
+                self.votecount.adjust_totals(upvotes=-1, downvotes=1)
 
+            net_change = direction - self.direction
+            self.direction = direction
+            record_on_leaderboards(self.votecount, net_change,
+                                   self.date_created)
+            send_vote_events(vote_changed, [self])
+        return net_change
 
     def delete(self, save_votecount=False):
         '''
         If a Vote is deleted and save_votecount=True, it will preserve the 
-        VoteCount object's total.  However, under normal circumstances, a 
-        delete() will trigger a subtraction from the VoteCount object's total.
+        VoteCount object's total (and VoteBucket), counting the vote as
+        archived (see VoteCount.archived_upvotes).  However, under normal
+        circumstances, a delete() will trigger a subtraction from the
+        VoteCount object's total (and send vote_removed).
 
         NOTE: This doesn't work at all during a queryset.delete().
         '''
-        if not save_votecount:
-            if self.direction == UPVOTE:
-                self.votecount.upvotes -= 1
+        with aftercommit.atomic():
+            if save_votecount:
+                VoteCount.objects.record_archived({self.votecount_id: (
+                        int(self.direction == UPVOTE),
+                        int(self.direction == DOWNVOTE))})
             else:
-                self.votecount.downvotes -= 1
-            self.votecount.save()
-        super(Vote, self).delete()
+                if self.direction == UPVOTE:
+                    self.votecount.adjust_totals(upvotes=-1)
+                else:
+                    self.votecount.adjust_totals(downvotes=-1)
+                if buckets_enabled():
+                    VoteBucket.objects.increment(self.votecount_id,
+                            floor_hour(self.date_created), votes=-1)
+                record_on_leaderboards(self.votecount, -self.direction,
+                                       self.date_created)
+                send_vote_events(vote_removed, [self])
+            super(Vote, self).delete()
+
+class VoteEventManager(models.Manager):
+    def since(self, cursor=0, limit=1000):
+        '''
+        Returns up to `limit` events after `cursor` (the pk of the last event
+        a consumer processed, 0 to start), oldest first.
+
+        Note that pks are handed out when the events are written, so a
+        transaction that commits late can add an event just behind a
+        consumer's cursor.  Consumers that mustn't miss any should re-read
+        a few recent events and skip the ones they've seen.
+        '''
+        return self.get_queryset().filter(pk__gt=cursor) \
+                    .order_by('pk')[:limit]
+
+class VoteEvent(models.Model):
+    '''
+    Append-only outbox of vote events, written (with VOTECOUNT_OUTBOX = True)
+    in the same transaction as the votes themselves, for consumers that
+    follow the votes (search indexes, notifications, ...) without scanning
+    the Vote table.  See VoteEventManager.since().
+
+    The Vote may be gone by the time an event is read, so only its pk is
+    kept, along with what the consumers need to know about it.
+    '''
+    CAST = 1
+    CHANGED = 2
+    REMOVED = 3
+    KINDS = ((CAST, 'cast'), (CHANGED, 'changed'), (REMOVED, 'removed'))
+
+    objects = VoteEventManager()
+
+    kind = models.PositiveSmallIntegerField(choices=KINDS)
+    vote_pk = models.IntegerField()
+    user = models.ForeignKey(AUTH_USER_MODEL, related_name='+')
+    votecount = models.ForeignKey(VoteCount, related_name='+')
+    # The direction after the event, or of the removed vote
+    direction = models.SmallIntegerField()
+    date_created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Vote Event'
+        verbose_name_plural = 'Vote Events'
+
+    def __unicode__(self):
+        return u'%s of vote %s' % (self.get_kind_display(), self.vote_pk)
+
+EVENT_KINDS = {
+    vote_cast: VoteEvent.CAST,
+    vote_changed: VoteEvent.CHANGED,
+    vote_removed: VoteEvent.REMOVED,
+}
+
+def record_on_leaderboards(votecount, change, date_created):
+    '''
+    Adds the net change of a vote cast at `date_created` to the leaderboards
+    (see voting.leaderboard) once the vote's transaction commits.
+    '''
+    aftercommit.defer(leaderboard.record, votecount.content_type_id,
+                      votecount.pk, change, date_created)
+
+def wants_events(signal):
+    '''
+    Whether anybody needs the events of `signal`, ie it has receivers or
+    there is an outbox.  Lets batch operations skip loading the votes.
+    '''
+    return outbox_enabled() or signal.has_listeners(Vote)
+
+def send_vote_events(signal, votes):
+    '''
+    Sends `signal` for a list of votes and appends them to the outbox if
+    VOTECOUNT_OUTBOX is set, with one INSERT.
+    '''
+    if not votes:
+        return
+    if outbox_enabled():
+        now = timezone.now()
+        VoteEvent.objects.bulk_create([VoteEvent(kind=EVENT_KINDS[signal],
+                vote_pk=vote.pk, user_id=vote.user_id,
+                votecount_id=vote.votecount_id, direction=vote.direction,
+                date_created=now) for vote in votes])
+    signal.send(sender=Vote, votes=votes)
@@ -0,0 +1,93 @@
+'''
+Optional rate limiting of votes per IP address and per user.
+
+Limits are configured with VOTECOUNT_RATE_LIMITS as (votes, seconds) pairs,
+for all votes ('default') and per content type ('app_label.model'), eg:
+
+    VOTECOUNT_RATE_LIMITS = {
+        'default': {'ip': (60, 60), 'user': (20, 60)},
+        'news.article': {'user': (5, 60)},
+    }
+
+The votes are counted in a sliding window kept in the cache named by
+VOTECOUNT_RATE_LIMIT_CACHE (default 'default'), so checking a limit never
+queries the database.  Use a shared cache (eg, memcached) if you run more
+than one process.
+'''
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from voting.utils import get_ip
+
+def get_rules(scope):
+    limits = getattr(settings, 'VOTECOUNT_RATE_LIMITS', None) or {}
+    return limits.get(scope, {})
+
+def has_content_type_limits():
+    '''
+    Whether any content type has limits of its own, ie whether callers need
+    to look up content types to check them.
+    '''
+    limits = getattr(settings, 'VOTECOUNT_RATE_LIMITS', None) or {}
+    return any(scope != 'default' for scope in limits)
+
+def get_scope(content_type_id=None):
+    '''
+    Returns the VOTECOUNT_RATE_LIMITS key for a content type, or 'default'.
+    '''
+    if content_type_id is None:
+        return 'default'
+    from django.contrib.contenttypes.models import ContentType
+    ct = ContentType.objects.get_for_id(content_type_id)
+    return '%s.%s' % (ct.app_label, ct.model)
+
+def hit(key, limit, period, votes=1):
+    '''
+    Counts `votes` more for `key` and returns True if that makes more than
+    `limit` votes in the last `period` seconds.
+
+    The count is a sliding window approximated from two fixed windows: all
+    of the current one plus the part of the previous one that still falls
+    into the last `period` seconds.
+    '''
+    cache = caches[getattr(settings, 'VOTECOUNT_RATE_LIMIT_CACHE', 'default')]
+    now = time.time()
+    window = int(now // period)
+    current_key = 'voting:rate:%s:%s' % (key, window)
+    previous_key = 'voting:rate:%s:%s' % (key, window - 1)
+
+    cache.add(current_key, 0, period * 2)
+    try:
+        current = cache.incr(current_key, votes)
+    except ValueError:
+        # Expired or evicted in the meantime
+        cache.set(current_key, votes, period * 2)
+        current = votes
+    previous = cache.get(previous_key, 0)
+
+    weight = 1 - (now % period) / float(period)
+    return previous * weight + current > limit
+
+def is_limited(request, content_type_id=None, votes=1):
+    '''
+    Counts `votes` more for the request's IP address and user and returns
+    True if they are over one of the limits for the content type (or the
+    'default' limits if none is given).
+    '''
+    scope = get_scope(content_type_id)
+    rules = get_rules(scope)
+    if not rules:
+        return False
+
+    idents = {'ip': get_ip(request)}
+    if request.user.is_authenticated():
+        idents['user'] = request.user.pk
+
+    limited = False
+    for kind, (limit, period) in rules.items():
+        if kind in idents:
+            key = '%s:%s:%s' % (scope, kind, idents[kind])
+            limited = hit(key, limit, period, votes) or limited
+    return limited
@@ -0,0 +1,62 @@
+'''
+Models can keep a copy of their vote sum in a field of their own, so their
+querysets can be filtered and ordered by it without going through the
+generic VoteCount table:
+
+    import voting
+    voting.register(Article, sum_field='score')
+
+    Article.objects.order_by('-score')
+
+Register the models once the app registry is ready, eg in
+AppConfig.ready().  The field is updated with an atomic F() UPDATE whenever
+the vote sum of a VoteCount changes, ie on every vote, or when the vote
+buffer is flushed or counter shards are folded.  The `sync_vote_sums`
+command copies the current sums over, eg after registering a model.
+'''
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import F
+
+_registry = {}
+
+def register(model, sum_field):
+    '''
+    Mirrors the vote sum of `model`'s objects in their `sum_field`.
+    '''
+    # Fail early on typos
+    model._meta.get_field(sum_field)
+    _registry[model] = sum_field
+
+def unregister(model):
+    _registry.pop(model, None)
+
+def get_sum_field(model):
+    '''
+    Returns the field a model mirrors its vote sum in, or None.
+    '''
+    return _registry.get(model)
+
+def get_registered():
+    return dict(_registry)
+
+def mirror_changes(content_type_id, changes):
+    '''
+    Applies a {object_pk: vote sum change} map to the sum field of the
+    objects of a registered model, with one UPDATE per distinct change.
+    '''
+    if not _registry:
+        return
+    model = ContentType.objects.get_for_id(content_type_id).model_class()
+    sum_field = _registry.get(model)
+    if sum_field is None:
+        return
+
+    by_change = {}
+    for object_pk, change in changes.items():
+        if change:
+            by_change.setdefault(change, []).append(object_pk)
+    # The base manager, so a default manager that hides some objects (eg
+    # soft-deleted ones) doesn't leave their sums behind
+    for change, object_pks in by_change.items():
+        model._base_manager.filter(pk__in=object_pks) \
+                .update(**{sum_field: F(sum_field) + change})
@@ -2,9 +2,11 @@ from django import template
 from django.template import TemplateSyntaxError
 from django.contrib.contenttypes.models import ContentType
 from django.core.urlresolvers import reverse
-from django.core.exceptions import MultipleObjectsReturned
+from django.utils.encoding import force_text
+from django.conf import settings
 
-from voting.models import VoteCount
+from voting.models import Vote, VoteCount
+from voting import cache as vote_cache
 
 register = template.Library()
 
@@ -20,6 +22,42 @@ def get_target_ctype_pk(context, object_expr):
     return ContentType.objects.get_for_model(obj), obj.pk
 
 
+# Name of the context variable {% prefetch_vote_counts %} stores its
+# {(content_type_id, object_pk): VoteCount} map under.
+PREFETCHED_VOTECOUNTS = '_voting_prefetched_votecounts'
+
+def is_lazy():
+    '''
+    With VOTECOUNT_LAZY_CREATE = True the tags never write to the database:
+    objects without a VoteCount show 0 votes and get a deferred pk, and the
+    VoteCount is only created by the first real vote.
+    '''
+    return getattr(settings, 'VOTECOUNT_LAZY_CREATE', False)
+
+def get_votecount(context, ctype, object_pk, create=True):
+    '''
+    Returns the VoteCount for the given object, using the counts loaded by
+    {% prefetch_vote_counts %} if there are any and falling back to the
+    database otherwise.
+
+    If there is no VoteCount for the object, it is created, unless `create`
+    is False, in which case None is returned.
+    '''
+    prefetched = context.get(PREFETCHED_VOTECOUNTS, {})
+    key = (ctype.pk, force_text(object_pk))
+    if key in prefetched and (prefetched[key] is not None or not create):
+        return prefetched[key]
+
+    if create:
+        obj, created = VoteCount.objects.get_or_create(content_type=ctype, 
+                        object_pk=object_pk)
+    else:
+        obj = VoteCount.objects.filter(content_type=ctype,
+                        object_pk=object_pk).first()
+    prefetched[key] = obj
+    return obj
+
+
 def return_period_from_string(arg):
     '''
     Takes a string such as "days=1,seconds=30" and strips the quotes
@@ -83,29 +121,23 @@ class GetVoteCount(template.Node):
     def render(self, context):
         ctype, object_pk = get_target_ctype_pk(context, self.object_expr)
         
-        try:
-            obj, created = VoteCount.objects.get_or_create(content_type=ctype, 
-                        object_pk=object_pk)
-        except MultipleObjectsReturned:
-            # from voting.models
-            # Because we are using a models.TextField() for `object_pk` to
-            # allow *any* primary key type (integer or text), we
-            # can't use `unique_together` or `unique=True` to gaurantee
-            # that only one VoteCount object exists for a given object.
-
-            # remove duplicate
-            items = VoteCount.objects.all().filter(content_type=ctype, object_pk=object_pk)
-            obj = items[0]
-            for extra_items in items[1:]:
-                extra_items.delete()
-                
-        if self.period: # if user sets a time period, use it
-            try:
-                votes = obj.votes_in_last(**self.period)
-            except:
-                votes = '[votecount error w/ time period]'
+        if not self.period and vote_cache.is_enabled():
+            # Served from the vote cache, no VoteCount needed
+            upvotes, downvotes = VoteCount.objects.get_totals(ctype, object_pk)
+            votes = upvotes - downvotes
         else:
-            votes = obj.vote_sum
+            obj = get_votecount(context, ctype, object_pk,
+                                create=not is_lazy())
+            if obj is None: # lazy mode and nobody voted yet
+                votes = 0
+            elif self.period: # if user sets a time period, use it
+                try:
+                    votes = obj.votes_in_last(**self.period)
+                except:
+                    votes = '[votecount error w/ time period]'
+            else:
+                upvotes, downvotes = obj.current_totals()
+                votes = upvotes - downvotes
         
         if self.as_varname: # if user gives us a variable to return
             context[self.as_varname] = str(votes)
@@ -165,19 +197,226 @@ class GetVoteObjectPk(template.Node):
 
     def render(self, context):
         ctype, object_pk = get_target_ctype_pk(context, self.object_expr)
-        obj, created = VoteCount.objects.get_or_create(content_type=ctype, 
-                        object_pk=object_pk)
+        obj = get_votecount(context, ctype, object_pk, create=not is_lazy())
+        if obj is None: # lazy mode: created by the first vote instead
+            vote_pk = VoteCount.objects.deferred_pk(ctype, object_pk)
+        else:
+            vote_pk = str(obj.pk)
         
         if self.as_varname: # if user gives us a variable to return
-            context[self.as_varname] = str(obj.pk) 
+            context[self.as_varname] = vote_pk
             return ''
         else:
-            return str(obj.pk)
+            return vote_pk
 
 def get_vote_object_pk(parser, token):
     '''
     Gets or creates the pk for the given object.
+
+    With VOTECOUNT_LAZY_CREATE = True, objects without a VoteCount get a
+    signed, deferred pk instead (see VoteCountManager.deferred_pk); the
+    vote view creates the VoteCount on the first vote.
     '''
     return GetVoteObjectPk.handle_token(parser, token)
 
-register.tag('get_vote_object_pk', get_vote_object_pk)
\ No newline at end of file
+register.tag('get_vote_object_pk', get_vote_object_pk)
+
+class PrefetchVoteCounts(template.Node):
+
+    def handle_token(cls, parser, token):
+        args = token.contents.split()
+
+        # {% prefetch_vote_counts [object_list] %}
+        if len(args) == 2:
+            return cls(object_list_expr = parser.compile_filter(args[1]))
+        else:
+            raise TemplateSyntaxError, \
+                    "'prefetch_vote_counts' requires " + \
+                    "'[object_list]' " + \
+                    "(got %r)" % args
+
+    handle_token = classmethod(handle_token)
+
+    def __init__(self, object_list_expr):
+        self.object_list_expr = object_list_expr
+
+    def render(self, context):
+        try:
+            object_list = self.object_list_expr.resolve(context)
+        except template.VariableDoesNotExist:
+            return ''
+
+        # Group by model so every content type costs one query
+        by_model = {}
+        for obj in object_list or []:
+            by_model.setdefault(obj.__class__, []).append(obj)
+
+        prefetched = context.get(PREFETCHED_VOTECOUNTS)
+        if prefetched is None:
+            # Stored in the outermost context so that it outlives any
+            # {% for %}/{% with %} block the tag is used in
+            prefetched = context.dicts[0][PREFETCHED_VOTECOUNTS] = {}
+
+        for model, objects in by_model.items():
+            ctype = ContentType.objects.get_for_model(model)
+            votecounts = VoteCount.objects.get_for_objects(objects)
+            for obj in objects:
+                # None marks objects known to have no VoteCount yet
+                prefetched[(ctype.pk, force_text(obj.pk))] = \
+                        votecounts.get(obj.pk)
+        return ''
+
+def prefetch_vote_counts(parser, token):
+    '''
+    Loads the VoteCounts of every object in a list with one query per content
+    type, so the {% get_vote_count %} and {% get_vote_object_pk %} tags used
+    for those objects further down the template don't each hit the database.
+
+    {% prefetch_vote_counts [object_list] %}
+    '''
+    return PrefetchVoteCounts.handle_token(parser, token)
+
+register.tag('prefetch_vote_counts', prefetch_vote_counts)
+
+
+# Name of the context variable {% get_vote_directions %} stores its
+# {(content_type_id, object_pk): direction} map under.
+PREFETCHED_DIRECTIONS = '_voting_prefetched_directions'
+
+def get_context_user(context):
+    '''
+    Returns the user of the request being rendered, or None.
+    '''
+    user = context.get('user')
+    if user is None and context.get('request') is not None:
+        user = getattr(context['request'], 'user', None)
+    return user
+
+class GetVoteDirections(template.Node):
+
+    def handle_token(cls, parser, token):
+        args = token.contents.split()
+
+        # {% get_vote_directions for [object_list] %}
+        if len(args) == 3 and args[1] == 'for':
+            return cls(object_list_expr = parser.compile_filter(args[2]))
+
+        # {% get_vote_directions for [object_list] as [var] %}
+        elif len(args) == 5 and args[1] == 'for' and args[3] == 'as':
+            return cls(object_list_expr = parser.compile_filter(args[2]),
+                        as_varname  = args[4],)
+        else:
+            raise TemplateSyntaxError, \
+                    "'get_vote_directions' requires " + \
+                    "'for [object_list] as [var]' " + \
+                    "(got %r)" % args
+
+    handle_token = classmethod(handle_token)
+
+    def __init__(self, object_list_expr, as_varname=None):
+        self.object_list_expr = object_list_expr
+        self.as_varname = as_varname
+
+    def render(self, context):
+        try:
+            object_list = list(self.object_list_expr.resolve(context) or [])
+        except template.VariableDoesNotExist:
+            return ''
+
+        user = get_context_user(context)
+        if user is None:
+            directions = {}
+        else:
+            directions = Vote.objects.directions_for_user(user, object_list)
+
+        prefetched = context.get(PREFETCHED_DIRECTIONS)
+        if prefetched is None:
+            # Stored in the outermost context so that it outlives any
+            # {% for %}/{% with %} block the tag is used in
+            prefetched = context.dicts[0][PREFETCHED_DIRECTIONS] = {}
+        for obj in object_list:
+            ctype = ContentType.objects.get_for_model(obj)
+            prefetched[(ctype.pk, force_text(obj.pk))] = \
+                    directions.get(obj.pk, 0)
+
+        if self.as_varname: # if user gives us a variable to return
+            context[self.as_varname] = directions
+        return ''
+
+def get_vote_directions(parser, token):
+    '''
+    Loads the current user's votes on every object in a list with one query,
+    for {% get_vote_direction %} to use further down the template.
+
+    - Load the votes:
+      {% get_vote_directions for [object_list] %}
+
+    - Also get them as an {object.pk: direction} dict:
+      {% get_vote_directions for [object_list] as [var] %}
+    '''
+    return GetVoteDirections.handle_token(parser, token)
+
+register.tag('get_vote_directions', get_vote_directions)
+
+class GetVoteDirection(template.Node):
+
+    def handle_token(cls, parser, token):
+        args = token.contents.split()
+
+        # {% get_vote_direction for [obj] %}
+        if len(args) == 3 and args[1] == 'for':
+            return cls(object_expr = parser.compile_filter(args[2]))
+
+        # {% get_vote_direction for [obj] as [var] %}
+        elif len(args) == 5 and args[1] == 'for' and args[3] == 'as':
+            return cls(object_expr = parser.compile_filter(args[2]),
+                        as_varname  = args[4],)
+        else:
+            raise TemplateSyntaxError, \
+                    "'get_vote_direction' requires " + \
+                    "'for [object] as [var]' " + \
+                    "(got %r)" % args
+
+    handle_token = classmethod(handle_token)
+
+    def __init__(self, object_expr, as_varname=None):
+        self.object_expr = object_expr
+        self.as_varname = as_varname
+
+    def render(self, context):
+        try:
+            obj = self.object_expr.resolve(context)
+        except template.VariableDoesNotExist:
+            return ''
+
+        ctype = ContentType.objects.get_for_model(obj)
+        prefetched = context.get(PREFETCHED_DIRECTIONS, {})
+        key = (ctype.pk, force_text(obj.pk))
+        if key in prefetched:
+            direction = prefetched[key]
+        else:
+            user = get_context_user(context)
+            if user is None:
+                direction = 0
+            else:
+                direction = Vote.objects.directions_for_user(user, [obj]) \
+                                .get(obj.pk, 0)
+
+        if self.as_varname: # if user gives us a variable to return
+            context[self.as_varname] = direction
+            return ''
+        else:
+            return str(direction)
+
+def get_vote_direction(parser, token):
+    '''
+    Returns the current user's vote on an object: 1, -1, or 0 if they
+    haven't voted on it.  Use {% get_vote_directions %} first when
+    rendering a list of objects.
+
+    {% get_vote_direction for [object] %}
+    {% get_vote_direction for [object] as [var] %}
+    '''
+    return GetVoteDirection.handle_token(parser, token)
+
+register.tag('get_vote_direction', get_vote_direction)
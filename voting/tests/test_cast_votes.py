@@ -0,0 +1,129 @@
+import json
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError
+from django.test import TestCase
+
+from voting.models import Vote, VoteCount
+
+
+class CastVotesTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('voter', password='secret')
+        self.ctype = ContentType.objects.get_for_model(User)
+        self.objects = [User.objects.create_user('object%d' % i)
+                        for i in range(3)]
+        self.votecounts = [VoteCount.objects.create(content_type=self.ctype,
+                                                    object_pk=str(obj.pk))
+                           for obj in self.objects]
+
+    def get_totals(self, votecount):
+        votecount = VoteCount.objects.get(pk=votecount.pk)
+        return votecount.upvotes, votecount.downvotes, votecount.vote_sum
+
+    def get_direction(self, votecount):
+        vote = Vote.objects.filter(user=self.user, votecount=votecount).first()
+        return vote.direction if vote else 0
+
+    def test_replay(self):
+        first, second, third = self.votecounts
+        results = Vote.objects.cast_votes(self.user, [
+            (first.pk, 1),
+            # Withdrawn and cast again
+            (second.pk, 1), (second.pk, 1), (second.pk, -1),
+            # Strings and ints are the same VoteCount, cast and withdrawn
+            (third.pk, 1), (str(third.pk), 1),
+        ], '127.0.0.1')
+        self.assertEqual([(votecount.pk, direction, net_change)
+                          for votecount, direction, net_change in results],
+                         [(first.pk, 1, 1), (second.pk, -1, -1),
+                          (third.pk, 0, 0)])
+        self.assertEqual(Vote.objects.count(), 2)
+        self.assertEqual(self.get_totals(first), (1, 0, 1))
+        self.assertEqual(self.get_totals(second), (0, 1, -1))
+        self.assertEqual(self.get_totals(third), (0, 0, 0))
+
+    def test_flip_and_withdraw(self):
+        first, second, third = self.votecounts
+        for votecount in (first, second):
+            Vote.objects.cast_vote(self.user, votecount, 1, '127.0.0.1')
+        results = Vote.objects.cast_votes(self.user, [
+            (first.pk, -1), (second.pk, 1), (third.pk, -1)], '127.0.0.1')
+        self.assertEqual([net_change for votecount, direction, net_change
+                          in results], [-2, -1, -1])
+        self.assertEqual([self.get_direction(votecount)
+                          for votecount in self.votecounts], [-1, 0, -1])
+        self.assertEqual(self.get_totals(first), (0, 1, -1))
+        self.assertEqual(self.get_totals(second), (0, 0, 0))
+        self.assertEqual(self.get_totals(third), (0, 1, -1))
+        # The VoteCounts returned have the fresh totals
+        self.assertEqual([votecount.current_totals()
+                          for votecount, direction, net_change in results],
+                         [(0, 1), (0, 0), (0, 1)])
+
+    def test_deferred_pks(self):
+        obj = User.objects.create_user('deferred')
+        token = VoteCount.objects.deferred_pk(self.ctype, obj.pk)
+        results = Vote.objects.cast_votes(self.user, [
+            (token, 1), (self.votecounts[0].pk, 1), (token, -1)], '127.0.0.1')
+        votecount = VoteCount.objects.get(content_type=self.ctype,
+                                          object_pk=str(obj.pk))
+        self.assertEqual(results[0][0].pk, votecount.pk)
+        self.assertEqual(self.get_direction(votecount), -1)
+        self.assertEqual(self.get_totals(votecount), (0, 1, -1))
+
+    def test_forged_deferred_pk(self):
+        token = '%s:%s:forged' % (self.ctype.pk, self.user.pk)
+        with self.assertRaises(VoteCount.DoesNotExist):
+            Vote.objects.cast_votes(self.user, [(token, 1)], '127.0.0.1')
+        self.assertFalse(VoteCount.objects.filter(
+                object_pk=str(self.user.pk)).exists())
+
+    def cast_concurrently(self):
+        '''
+        Makes the next bulk_create() clash with a vote a concurrent request
+        registered on the last object, after the user's votes were loaded.
+        '''
+        bulk_create = Vote.objects.bulk_create
+        def clashing_bulk_create(objs, *args, **kwargs):
+            del Vote.objects.bulk_create
+            Vote.objects.create(user=self.user, votecount=self.votecounts[-1],
+                                direction=1)
+            return bulk_create(objs, *args, **kwargs)
+        Vote.objects.bulk_create = clashing_bulk_create
+        self.addCleanup(Vote.objects.__dict__.pop, 'bulk_create', None)
+
+    def test_concurrent_vote(self):
+        self.cast_concurrently()
+        with self.assertRaises(IntegrityError):
+            Vote.objects.cast_votes(self.user, [
+                (votecount.pk, 1) for votecount in self.votecounts],
+                '127.0.0.1')
+        self.assertFalse(Vote.objects.exists())
+        for votecount in self.votecounts:
+            self.assertEqual(self.get_totals(votecount), (0, 0, 0))
+
+    def test_view_conflict(self):
+        self.client.login(username='voter', password='secret')
+        self.cast_concurrently()
+        response = self.client.post('/votes', json.dumps([
+                [votecount.pk, 1] for votecount in self.votecounts]),
+                content_type='application/json',
+                HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Vote.objects.exists())
+
+    def test_view(self):
+        self.client.login(username='voter', password='secret')
+        response = self.client.post('/votes', json.dumps([
+                [self.votecounts[0].pk, 1], [self.votecounts[1].pk, -1]]),
+                content_type='application/json',
+                HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 200)
+        votes = json.loads(response.content.decode('utf-8'))['votes']
+        self.assertEqual([(vote['votecount_pk'], vote['direction'],
+                           vote['vote_sum']) for vote in votes],
+                         [(self.votecounts[0].pk, 1, 1),
+                          (self.votecounts[1].pk, -1, -1)])
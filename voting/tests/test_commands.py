@@ -0,0 +1,54 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from voting.models import Vote, VoteBucket, VoteCount
+
+
+class RebuildVoteCountsTests(TestCase):
+
+    @override_settings(VOTECOUNT_BUFFERED=True)
+    def test_refuses_to_fix_while_buffered(self):
+        with self.assertRaises(CommandError):
+            call_command('rebuild_vote_counts', stdout=StringIO())
+        out = StringIO()
+        call_command('rebuild_vote_counts', dry_run=True, stdout=out)
+        self.assertIn('0 VoteCounts have drifted', out.getvalue())
+
+
+class RebuildVoteBucketsTests(TestCase):
+
+    def setUp(self):
+        self.users = [User.objects.create_user('voter%d' % i)
+                      for i in range(4)]
+        self.votecount = VoteCount.objects.create(
+                content_type=ContentType.objects.get_for_model(User),
+                object_pk=str(self.users[0].pk))
+        for user in self.users:
+            Vote.objects.cast_vote(user, self.votecount, 1, '127.0.0.1')
+        # Cast before VOTECOUNT_VOTE_BUCKETS was turned on
+        Vote.objects.filter(user__in=self.users[:3]).update(
+                date_created=timezone.now() - datetime.timedelta(days=2))
+
+    def test_backfill(self):
+        call_command('rebuild_vote_buckets', stdout=StringIO())
+        # The current hour is left to the votes
+        self.assertEqual(list(VoteBucket.objects.values_list('votes',
+                                                             flat=True)),
+                         [3])
+        with self.settings(VOTECOUNT_VOTE_BUCKETS=True):
+            votecount = VoteCount.objects.get(pk=self.votecount.pk)
+            self.assertEqual(votecount.votes_in_last(days=3), 3)
+
+    def test_archived_hours(self):
+        call_command('rebuild_vote_buckets', stdout=StringIO())
+        Vote.objects.filter(user__in=self.users[:3]).delete()
+        call_command('rebuild_vote_buckets', stdout=StringIO())
+        self.assertEqual(VoteBucket.objects.get().votes, 3)
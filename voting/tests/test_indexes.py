@@ -0,0 +1,65 @@
+import datetime
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from voting.models import Vote, VoteCount
+
+
+@skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN is SQLite's")
+class VoteIndexTests(TestCase):
+    '''
+    Checks that the hot Vote queries are served by the indexes in
+    Vote.Meta, without sorting.
+    '''
+
+    def setUp(self):
+        self.user = User.objects.create_user('voter')
+        self.votecount = VoteCount.objects.create(
+                content_type=ContentType.objects.get_for_model(User),
+                object_pk=str(self.user.pk))
+        Vote.objects.create(user=self.user, votecount=self.votecount,
+                            direction=1)
+
+    def get_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        cursor = connection.cursor()
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return ' '.join(row[-1] for row in cursor.fetchall())
+
+    def assertSearchesIndex(self, queryset, *columns):
+        '''
+        Asserts that the query searches an index on `columns` (as SQLite
+        prints them, eg 'user_id=?') and doesn't sort.
+        '''
+        plan = self.get_plan(queryset)
+        self.assertIn('USING INDEX', plan.replace('COVERING ', ''))
+        for column in columns:
+            self.assertIn(column, plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_no_default_ordering(self):
+        sql, params = Vote.objects.all().query.sql_with_params()
+        self.assertNotIn('ORDER BY', sql)
+
+    def test_users_vote(self):
+        # The lookup of cast_vote()
+        self.assertSearchesIndex(Vote.objects.filter(user=self.user,
+                                                     votecount=self.votecount),
+                                 'user_id=?', 'votecount_id=?')
+
+    def test_votes_in_last(self):
+        period = timezone.now() - datetime.timedelta(days=7)
+        self.assertSearchesIndex(
+                self.votecount.vote_set.filter(date_created__gte=period),
+                'votecount_id=? AND date_created>?')
+
+    def test_archive_cutoff(self):
+        # The votes archive_votes picks
+        cutoff = timezone.now() - datetime.timedelta(days=30)
+        self.assertSearchesIndex(Vote.objects.filter(date_created__lt=cutoff),
+                                 '(date_created<?)')
@@ -0,0 +1,64 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from voting import leaderboard
+from voting.models import Vote, VoteCount
+
+
+@override_settings(VOTECOUNT_LEADERBOARDS={'auth.user': {'size': 5}})
+class LeaderboardTests(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        self.voter = User.objects.create_user('voter')
+        self.ctype = ContentType.objects.get_for_model(User)
+        self.votecount = VoteCount.objects.create(content_type=self.ctype,
+                                                  object_pk=str(self.voter.pk))
+
+    def get_board(self):
+        return leaderboard.get_top(self.ctype.pk)
+
+    def test_old_votes_stay_off_the_board(self):
+        Vote.objects.cast_vote(self.voter, self.votecount, 1, '127.0.0.1')
+        Vote.objects.update(
+                date_created=timezone.now() - datetime.timedelta(days=3))
+        caches['default'].clear()
+        self.assertEqual(self.get_board(), [])
+        # Flipping and withdrawing the old vote doesn't touch today's board
+        Vote.objects.cast_vote(self.voter, self.votecount, -1, '127.0.0.1')
+        self.assertEqual(self.get_board(), [])
+        Vote.objects.cast_vote(self.voter, self.votecount, -1, '127.0.0.1')
+        self.assertEqual(self.get_board(), [])
+
+    def test_votes_match_a_rebuild(self):
+        self.assertEqual(self.get_board(), [])
+        Vote.objects.cast_vote(self.voter, self.votecount, 1, '127.0.0.1')
+        Vote.objects.cast_vote(self.voter, self.votecount, -1, '127.0.0.1')
+        self.assertEqual(self.get_board(), [(self.votecount.pk, -1)])
+        caches['default'].clear()
+        self.assertEqual(self.get_board(), [(self.votecount.pk, -1)])
+
+    def test_busy_lock(self):
+        self.assertEqual(self.get_board(), [])
+        key = leaderboard.make_key(self.ctype.pk, 'day',
+                                   leaderboard.period_start('day'))
+        caches['default'].add(key + ':lock', 1)
+        Vote.objects.cast_vote(self.voter, self.votecount, 1, '127.0.0.1')
+        # The board is kept, the change is added once the lock is free
+        self.assertEqual(self.get_board(), [])
+        caches['default'].delete(key + ':lock')
+        other = User.objects.create_user('other')
+        Vote.objects.cast_vote(other, self.votecount, 1, '127.0.0.1')
+        self.assertEqual(self.get_board(), [(self.votecount.pk, 2)])
+
+    def test_bulk_delete(self):
+        Vote.objects.cast_vote(self.voter, self.votecount, 1, '127.0.0.1')
+        self.assertEqual(self.get_board(), [(self.votecount.pk, 1)])
+        Vote.objects.bulk_delete_votes()
+        self.assertEqual(self.get_board(), [])
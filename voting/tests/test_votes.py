@@ -0,0 +1,138 @@
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from voting import buffer as vote_buffer
+from voting.admin import VoteAdmin
+from voting import models as voting_models
+from voting.models import Vote, VoteCount, vote_cast
+
+
+class ReceiverError(Exception):
+    pass
+
+def failing_receiver(sender, votes, **kwargs):
+    raise ReceiverError
+
+
+@override_settings(VOTECOUNT_CACHE='default')
+class RollbackTests(TestCase):
+    '''
+    A vote whose transaction rolls back mustn't leave its change in the
+    vote buffer, the cache or the leaderboards.
+    '''
+
+    def setUp(self):
+        self.user = User.objects.create_user('voter')
+        self.ctype = ContentType.objects.get_for_model(User)
+        self.votecount = VoteCount.objects.create(content_type=self.ctype,
+                                                  object_pk=str(self.user.pk))
+        caches['default'].clear()
+        vote_cast.connect(failing_receiver, sender=Vote)
+        self.addCleanup(vote_cast.disconnect, failing_receiver, sender=Vote)
+
+    def assertRolledBack(self):
+        self.assertFalse(Vote.objects.exists())
+        votecount = VoteCount.objects.get(pk=self.votecount.pk)
+        self.assertEqual((votecount.upvotes, votecount.downvotes), (0, 0))
+        self.assertEqual(VoteCount.objects.get_totals(self.ctype,
+                                                      self.user.pk), (0, 0))
+
+    def test_cache(self):
+        # Cache the totals first, so a vote would increment them
+        VoteCount.objects.get_totals(self.ctype, self.user.pk)
+        with self.assertRaises(ReceiverError):
+            Vote.objects.cast_vote(self.user, self.votecount, 1, '127.0.0.1')
+        self.assertRolledBack()
+
+    @override_settings(VOTECOUNT_BUFFERED=True)
+    def test_buffer(self):
+        with self.assertRaises(ReceiverError):
+            Vote.objects.cast_vote(self.user, self.votecount, 1, '127.0.0.1')
+        self.assertEqual(vote_buffer.get_pending(self.votecount.pk), (0, 0))
+        self.assertRolledBack()
+
+    @override_settings(VOTECOUNT_LEADERBOARDS={'auth.user': {'size': 10}})
+    def test_leaderboard(self):
+        self.assertEqual(VoteCount.objects.get_leaderboard(User), [])
+        with self.assertRaises(ReceiverError):
+            Vote.objects.cast_vote(self.user, self.votecount, 1, '127.0.0.1')
+        self.assertEqual(VoteCount.objects.get_leaderboard(User), [])
+        self.assertRolledBack()
+
+    def test_votes_after_rollback(self):
+        with self.assertRaises(ReceiverError):
+            Vote.objects.cast_vote(self.user, self.votecount, 1, '127.0.0.1')
+        vote_cast.disconnect(failing_receiver, sender=Vote)
+        VoteCount.objects.get_totals(self.ctype, self.user.pk)
+        Vote.objects.cast_vote(self.user, self.votecount, 1, '127.0.0.1')
+        self.assertEqual(VoteCount.objects.get_totals(self.ctype,
+                                                      self.user.pk), (1, 0))
+
+
+class BulkDeleteTests(TestCase):
+
+    def setUp(self):
+        self.users = [User.objects.create_user('voter%d' % i)
+                      for i in range(5)]
+        self.ctype = ContentType.objects.get_for_model(User)
+        self.votecounts = [VoteCount.objects.create(content_type=self.ctype,
+                                                    object_pk=str(user.pk))
+                           for user in self.users[:2]]
+        for user in self.users:
+            for votecount, direction in zip(self.votecounts, (1, -1)):
+                Vote.objects.cast_vote(user, votecount, direction,
+                                       '127.0.0.1')
+
+    def get_totals(self, votecount):
+        votecount = VoteCount.objects.get(pk=votecount.pk)
+        return votecount.upvotes, votecount.downvotes
+
+    def test_batches(self):
+        batch_size = voting_models.DELETE_BATCH_SIZE
+        voting_models.DELETE_BATCH_SIZE = 2
+        try:
+            deleted = Vote.objects.bulk_delete_votes(
+                    Vote.objects.filter(user__in=self.users[:3]))
+        finally:
+            voting_models.DELETE_BATCH_SIZE = batch_size
+        self.assertEqual(deleted, 6)
+        self.assertEqual(Vote.objects.count(), 4)
+        self.assertEqual(self.get_totals(self.votecounts[0]), (2, 0))
+        self.assertEqual(self.get_totals(self.votecounts[1]), (0, 2))
+
+    def test_save_votecount(self):
+        Vote.objects.bulk_delete_votes(save_votecount=True)
+        self.assertFalse(Vote.objects.exists())
+        votecount = VoteCount.objects.get(pk=self.votecounts[0].pk)
+        self.assertEqual((votecount.upvotes, votecount.archived_upvotes),
+                         (5, 5))
+
+
+class AdminSearchTests(TestCase):
+
+    def setUp(self):
+        self.users = [User.objects.create_user('voter%d' % i)
+                      for i in range(3)]
+        self.votecount = VoteCount.objects.create(
+                content_type=ContentType.objects.get_for_model(User),
+                object_pk=str(self.users[0].pk))
+        Vote.objects.cast_vote(self.users[0], self.votecount, 1, '10.0.0.1')
+        with self.settings(VOTECOUNT_PACKED_IP=True):
+            for user in self.users[1:]:
+                Vote.objects.cast_vote(user, self.votecount, 1, '10.0.0.2')
+
+    def search(self, term):
+        vote_admin = VoteAdmin(Vote, admin.site)
+        queryset, use_distinct = vote_admin.get_search_results(
+                None, Vote.objects.filter(user__in=self.users[:2]), term)
+        return sorted(vote.user.username for vote in queryset)
+
+    def test_packed_ip(self):
+        self.assertEqual(self.search('10.0.0.1'), ['voter0'])
+        # The queryset's other filters still apply
+        self.assertEqual(self.search(' 10.0.0.2 '), ['voter1'])
+        self.assertEqual(self.search('10.0.0'), ['voter0'])
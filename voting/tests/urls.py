@@ -0,0 +1,9 @@
+from django.conf.urls import patterns, url
+
+from voting.views import update_vote_count_ajax, update_vote_counts_batch_ajax
+
+urlpatterns = patterns('',
+    url(r'^vote$', update_vote_count_ajax, name='votecount_update_ajax'),
+    url(r'^votes$', update_vote_counts_batch_ajax,
+        name='votecount_batch_update_ajax'),
+)
@@ -1,6 +1,9 @@
 import re
+import socket
 
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max, Min
 
 # this is not intended to be an all-knowing IP address regex
 IP_RE = re.compile('\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}')
@@ -35,3 +38,112 @@ def get_ip(request):
             pass
 
     return ip_address
+
+# IPv4 addresses are stored as IPv4-mapped IPv6 addresses (::ffff:a.b.c.d)
+IPV4_PREFIX = b'\x00' * 10 + b'\xff' * 2
+
+def pack_ip(ip_address, truncate=False):
+    """
+    Packs an IPv4 or IPv6 address into 16 bytes.  With truncate=True the
+    host part is zeroed (everything after the /24 of an IPv4 and the /48 of
+    an IPv6 address), so the voter can't be identified from it.
+    """
+    if ':' in ip_address:
+        packed = socket.inet_pton(socket.AF_INET6, ip_address)
+        if truncate:
+            packed = packed[:6] + b'\x00' * 10
+    else:
+        packed = IPV4_PREFIX + socket.inet_aton(ip_address)
+        if truncate:
+            packed = packed[:15] + b'\x00'
+    return packed
+
+def unpack_ip(packed):
+    """
+    Returns the address packed with pack_ip() as a string.
+    """
+    packed = bytes(packed)
+    if packed.startswith(IPV4_PREFIX):
+        return socket.inet_ntoa(packed[12:])
+    return socket.inet_ntop(socket.AF_INET6, packed)
+
+
+def merge_duplicate_votecounts(votecount_model, vote_model):
+    """
+    Merges VoteCount rows that share the same (content_type, object_pk) pair
+    into the oldest one.  Such duplicates could be created before the pair
+    was enforced unique by the database.
+
+    The votes of the duplicates are moved to the surviving row and their
+    totals are added to it.  If a user voted on both rows, only the vote on
+    the surviving row is kept and the totals are corrected accordingly.
+
+    The models are passed in so this can be used from a data migration, with
+    the historical models.  Only the totals are moved; the scores are filled
+    in by a later migration.
+
+    Returns the number of duplicate VoteCount rows that were removed.
+    """
+    groups = votecount_model.objects.values('content_type', 'object_pk') \
+                .annotate(count=Count('id'), keep_pk=Min('id')) \
+                .filter(count__gt=1)
+
+    removed = 0
+    for group in groups:
+        with transaction.atomic():
+            keep_pk = group['keep_pk']
+            extras = votecount_model.objects.filter(
+                        content_type=group['content_type'],
+                        object_pk=group['object_pk']).exclude(pk=keep_pk)
+
+            for extra in extras:
+                voters = list(vote_model.objects.filter(votecount=keep_pk) \
+                                .values_list('user', flat=True))
+                clashing = vote_model.objects.filter(votecount=extra,
+                                                     user__in=voters)
+                upvotes = extra.upvotes - clashing.filter(direction=1).count()
+                downvotes = extra.downvotes - \
+                            clashing.filter(direction=-1).count()
+                clashing.delete()
+
+                vote_model.objects.filter(votecount=extra).update(
+                                                        votecount=keep_pk)
+                votecount_model.objects.filter(pk=keep_pk).update(
+                            upvotes=F('upvotes') + max(upvotes, 0),
+                            downvotes=F('downvotes') + max(downvotes, 0))
+                extra.delete()
+                removed += 1
+
+    return removed
+
+
+def merge_duplicate_votes(vote_model, votecount_model):
+    """
+    Removes all but the latest Vote of a user on the same VoteCount, and
+    takes the removed votes out of the totals.  Such duplicates could be
+    created before the (user, votecount) pair was enforced unique by the
+    database.
+
+    The models are passed in so this can be used from a data migration.
+
+    Returns the number of duplicate votes that were removed.
+    """
+    groups = vote_model.objects.order_by().values('user', 'votecount') \
+                .annotate(count=Count('id'), keep_pk=Max('id')) \
+                .filter(count__gt=1)
+
+    removed = 0
+    for group in groups:
+        with transaction.atomic():
+            extras = vote_model.objects.filter(user=group['user'],
+                        votecount=group['votecount']) \
+                        .exclude(pk=group['keep_pk'])
+            upvotes = extras.filter(direction=1).count()
+            downvotes = extras.filter(direction=-1).count()
+            votecount_model.objects.filter(pk=group['votecount']).update(
+                        upvotes=F('upvotes') - upvotes,
+                        downvotes=F('downvotes') - downvotes)
+            extras.delete()
+            removed += upvotes + downvotes
+
+    return removed
@@ -1,9 +1,13 @@
 import json
 
+from django.db import IntegrityError
 from django.http import Http404, HttpResponse, HttpResponseBadRequest
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ObjectDoesNotExist
+from django.utils.encoding import force_text
 
+from voting import ratelimit
 from voting.utils import get_ip
 from voting.models import Vote, VoteCount, UPVOTE, DOWNVOTE
 
@@ -19,59 +23,30 @@ def _update_vote_count(request, votecount, direction):
     '''
     user = request.user
     ip_address = get_ip(request)
-    
-    net_change = 0
-
-    # TODO: Rate-limit users based on IP to avoid spamming
-    #votes_per_ip_limit = getattr(settings, 'VOTECOUNT_VOTES_PER_IP_LIMIT', 0)
-    # check limit on votes from a unique ip address (VOTECOUNT_VOTES_PER_IP_LIMIT)
-    #if votes_per_ip_limit:
-    #    if qs.filter(ip_address__exact=ip_address).count() > votes_per_ip_limit:
-    #        return net_change, False
 
-    # Check if the user already voted
-    try:
-        prev_vote = Vote.objects.get(user=user, votecount=votecount)
-        
-        # SLOW: Instead of deleting the old and creating a new vote, we really
-        # should just alter the old vote's direction and then change the 
-        # VoteCounts total accordingly. The VoteCount change should be done
-        # in the overridden save() method
-        
-        # Since the user already voted, remove it. Then check if the new vote
-        # is in a different direction, and if so, create that one
-        prev_direction = prev_vote.direction
-        prev_vote.delete()
-        net_change -= prev_direction
-        
-        if prev_direction != direction:
-            # TODO: Is there a better way to refresh this? Like in save()/delete() methods?
-            # Reload VoteCount from DB since the previous delete() just changed its up/downvote totals
-            votecount = VoteCount.objects.get(id=votecount.id)
-            
-            vote = Vote(votecount=votecount, direction=direction, ip_address=get_ip(request))
-            vote.user = user
-            vote.save()
-            net_change += direction
-    except Vote.DoesNotExist:
-        vote = Vote(votecount=votecount, direction=direction, ip_address=get_ip(request))
-        vote.user = user
-        vote.save()
-        net_change += direction
+    # Creates, withdraws or flips the user's vote in place
+    vote, net_change = Vote.objects.cast_vote(user, votecount, direction,
+                                              ip_address)
 
     return net_change, True
 
 def json_error_response(error_message):
     return HttpResponse(json.dumps(dict(success=False, error_message=error_message)))
 
-# TODO better status responses - consider model after django-voting,
-# right now the django handling isn't great.  should return the current
-# vote count so we could update it via javascript (since each view will
-# be one behind).
+def rate_limited_response():
+    return HttpResponse('Too Many Requests', status=429)
+
+def conflict_response():
+    return HttpResponse('Conflict', status=409)
+
 def update_vote_count_ajax(request):
     '''
     Ajax call that can be used to update a vote count.
 
+    Besides the net change, the response carries the fresh totals and the
+    user's current vote direction, so the page can be updated without
+    fetching it again.
+
     See template tags for how to implement.
     '''
 
@@ -85,6 +60,10 @@ def update_vote_count_ajax(request):
     if not request.user.is_authenticated():
         return HttpResponse('Unauthorized', status=401)
 
+    # Rate-limit before anything touches the database
+    if ratelimit.is_limited(request):
+        return rate_limited_response()
+
     # TODO: Should probably use a form for validating this
     # Parse inputs
     try:
@@ -97,9 +76,20 @@ def update_vote_count_ajax(request):
     if direction != UPVOTE and direction != DOWNVOTE:
         return HttpResponseBadRequest("Invalid vote direction")
 
+    # Rate-limit users and IPs per content type to avoid spamming, before
+    # a VoteCount is created for a deferred pk
+    if ratelimit.has_content_type_limits():
+        try:
+            ctypes = VoteCount.objects.content_types_for_vote_pks(
+                    [votecount_pk])
+        except:
+            return HttpResponseBadRequest("VoteCount object_pk not working")
+        if ratelimit.is_limited(request, ctypes.values()[0]):
+            return rate_limited_response()
+
     # Verify VoteCount pk is valid
     try:
-        votecount = VoteCount.objects.get(pk=votecount_pk)
+        votecount = VoteCount.objects.get_for_vote_pk(votecount_pk)
     except:
         return HttpResponseBadRequest("VoteCount object_pk not working")
 
@@ -110,5 +100,101 @@ def update_vote_count_ajax(request):
     else:
         status = "failed"
 
-    json_response = json.dumps({'status': status, 'net_change':net_change})
+    # The totals were refreshed by the vote itself, no need to query them
+    upvotes, downvotes = votecount.current_totals()
+
+    if not result:
+        # Not counted, so we don't know the user's vote without a query
+        direction = None
+    elif net_change == -direction:
+        # A vote in the same direction as the previous one withdraws it
+        direction = 0
+
+    json_response = json.dumps({'status': status,
+                                'net_change': net_change,
+                                'upvotes': upvotes,
+                                'downvotes': downvotes,
+                                'vote_sum': upvotes - downvotes,
+                                'direction': direction})
+    return HttpResponse(json_response, content_type="application/json")
+
+
+def update_vote_counts_batch_ajax(request):
+    '''
+    Ajax call that registers a batch of votes at once, eg the votes a client
+    queued while it was offline.
+
+    The POST body is a JSON array of [votecount_pk, direction] pairs, which
+    are applied in order as if they were posted to update_vote_count_ajax
+    one by one, but with a few queries for the whole batch (see
+    VoteManager.cast_votes).  At most VOTECOUNT_BATCH_LIMIT (default 100)
+    votes are accepted per request.
+    '''
+
+    # make sure this is an ajax request
+    if not request.is_ajax():
+        raise Http404()
+
+    if request.method == "GET":
+        return json_error_response("Votes counted via POST only.")
+        
+    if not request.user.is_authenticated():
+        return HttpResponse('Unauthorized', status=401)
+
+    # Parse inputs
+    try:
+        votes = [(votecount_pk, int(direction))
+                 for votecount_pk, direction in json.loads(request.body)]
+    except (ValueError, TypeError):
+        return HttpResponseBadRequest("Invalid batch of votes")
+
+    if len(votes) > getattr(settings, 'VOTECOUNT_BATCH_LIMIT', 100):
+        return HttpResponseBadRequest("Too many votes in one batch")
+
+    # Verify directions are valid
+    for votecount_pk, direction in votes:
+        if direction != UPVOTE and direction != DOWNVOTE:
+            return HttpResponseBadRequest("Invalid vote direction")
+
+    # Rate-limit before anything touches the database
+    if ratelimit.is_limited(request, votes=len(votes)):
+        return rate_limited_response()
+
+    # Then per content type, before any VoteCount is created
+    if ratelimit.has_content_type_limits():
+        try:
+            ctypes = VoteCount.objects.content_types_for_vote_pks(
+                    [votecount_pk for votecount_pk, direction in votes])
+        except (ObjectDoesNotExist, ValueError):
+            return HttpResponseBadRequest("VoteCount object_pk not working")
+        per_ctype = {}
+        for votecount_pk, direction in votes:
+            ctype_pk = ctypes[force_text(votecount_pk)]
+            per_ctype[ctype_pk] = per_ctype.get(ctype_pk, 0) + 1
+        for ctype_pk, count in per_ctype.items():
+            if ratelimit.is_limited(request, ctype_pk, votes=count):
+                return rate_limited_response()
+
+    # Verify VoteCount pks are valid while registering the votes
+    try:
+        results = Vote.objects.cast_votes(request.user, votes,
+                                          get_ip(request))
+    except (ObjectDoesNotExist, ValueError):
+        return HttpResponseBadRequest("VoteCount object_pk not working")
+    except IntegrityError:
+        # A concurrent request voted on one of the objects first, nothing
+        # of this batch was registered
+        return conflict_response()
+
+    response = []
+    for votecount, direction, net_change in results:
+        upvotes, downvotes = votecount.current_totals()
+        response.append({'votecount_pk': votecount.pk,
+                         'net_change': net_change,
+                         'direction': direction,
+                         'upvotes': upvotes,
+                         'downvotes': downvotes,
+                         'vote_sum': upvotes - downvotes})
+
+    json_response = json.dumps({'status': "success", 'votes': response})
     return HttpResponse(json_response, content_type="application/json")